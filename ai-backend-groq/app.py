@@ -1,22 +1,90 @@
 import os
+from startup import mark, lazy_import, register_warmup, run_warmups, report as startup_report, ready, FirstRequestTimer
 import base64
+import binascii
 import io
-from typing import Optional
-from fastapi import FastAPI, HTTPException, File, UploadFile
-from fastapi.responses import Response
+import asyncio
+import json
+import time
+from typing import Optional, List, Literal
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, File, UploadFile, WebSocket, WebSocketDisconnect, Request, Query
+from fastapi.responses import Response, FileResponse
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from gtts import gTTS
-import requests
+from starlette.websockets import WebSocketState
+from pydantic import BaseModel, Field, ValidationError
+mark('fastapi')
 from dotenv import load_dotenv
-import subprocess
-from generate_assets import generate_svg_with_llm
+import logging
+from ttl_cache import TTLCache, fingerprint
+from model_routing import chat_completion, routes_snapshot, UpstreamError
+from key_pool import default_pool as default_groq_keys
+from vocabulary_index import VocabularyIndex
+from level_prefetch import LevelPrefetcher
+from chat_budget import ChatMessage, ContextBudgetExceeded, fit_to_budget, truncate_to_tokens, MAX_MESSAGES, MAX_MESSAGE_CHARS
+import icon_variants
+import warm_snapshot
+import cassette
+from idempotency import IdempotencyMiddleware, build_store as build_idempotency_store, stats as idempotency_stats
+from level_validation import (
+    parse_level_items, validate_phoneme_level, validate_math_level,
+    phoneme_level_prompt, math_level_prompt, phoneme_repair_prompt, math_repair_prompt
+)
+from audio_payload import read_json_audio, digest as audio_digest, stats as audio_payload_stats
+from body_limits import BodyLimitMiddleware, stats as body_limit_stats
+from structured_logging import configure_logging, RequestIdMiddleware
+from request_timing import ServerTimingMiddleware, stage
+from http_caching import HTTPCachingMiddleware, precompressed, stats as http_caching_stats
 # Cargar variables de entorno
 load_dotenv()
 
-app = FastAPI(title='EduPlay Unified Backend', version='1.0.0')
+configure_logging()
+logger = logging.getLogger('app')
+mark('imports')
+
+# Con cassettes, las elecciones aleatorias (letra objetivo...) deben repetirse entre grabar y reproducir
+if cassette.mode() != 'off':
+    import random
+    random.seed(os.getenv('CASSETTE_SEED', '0'))
+    logger.info(f"📼 Cassette mode: {cassette.mode()}")
+
+async def warm_start():
+    # Primero el estado caliente del proceso anterior, luego los imports diferidos
+    await warm_snapshot.restore()
+    mark('snapshot_restored')
+    await run_warmups()
+    # Variantes PNG/WebP que falten, en segundo plano
+    await asyncio.to_thread(icons.backfill)
+
+@asynccontextmanager
+async def lifespan(app):
+    # /health responde ya; /ready espera a que terminen los warm-ups
+    mark('listening')
+    warmup_task = asyncio.create_task(warm_start())
+    snapshot_task = asyncio.create_task(warm_snapshot.run_periodic())
+    yield
+    snapshot_task.cancel()
+    if warmup_task.done():
+        # Solo si el snapshot anterior ya se cargó: si no, se sobreescribiría con menos estado
+        try:
+            warm_snapshot.save()
+        except Exception as e:
+            logger.warning(f"⚠️ Shutdown snapshot failed: {e}")
+    warmup_task.cancel()
+
+app = FastAPI(title='EduPlay Unified Backend', version='1.0.0', lifespan=lifespan)
 
-# CORS - Permitir todos los orígenes
+# Idempotency-Key en POST: los reintentos esperan a la petición en curso o reciben la respuesta guardada
+idempotency_store = build_idempotency_store()
+app.add_middleware(IdempotencyMiddleware, store=idempotency_store)
+
+# Límite de cuerpo por ruta (BODY_LIMITS / BODY_MAX_BYTES): 413 por Content-Length o al pasarse en streaming.
+# Va por fuera de Idempotency, que bufferiza el cuerpo para hashearlo.
+app.add_middleware(BodyLimitMiddleware)
+
+# CORS - Permitir todos los orígenes. Va por fuera de BodyLimit e Idempotency para que
+# sus respuestas propias (413, 422) también lleven Access-Control-Allow-Origin.
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -26,26 +94,84 @@ app.add_middleware(
     expose_headers=["*"]
 )
 
+# Server-Timing por etapas (decode, upstream, parse, validation, icon, synthesis) + profiler opcional (PROFILE_TOKEN)
+app.add_middleware(ServerTimingMiddleware)
+
+# Compresión br/gzip (JSON, SVG...; no MP3) y ETag / If-None-Match -> 304 en GET
+app.add_middleware(HTTPCachingMiddleware)
+
+# Request ID por petición (cabecera X-Request-ID) + línea de acceso estructurada
+app.add_middleware(RequestIdMiddleware)
+app.add_middleware(FirstRequestTimer)
+
 # Configuración
-GROQ_API_KEY = os.getenv('GROQ_API_KEY', '')
+# Pool de keys (GROQ_API_KEYS + GROQ_API_KEY): se usa la de más margen y se aparta la que da 429
+groq_keys = default_groq_keys()
 GROQ_API_URL = 'https://api.groq.com/openai/v1'
 
-if not GROQ_API_KEY:
-    print("⚠️ WARNING: GROQ_API_KEY no configurada")
+if not groq_keys:
+    logger.warning("⚠️ WARNING: GROQ_API_KEY no configurada")
+
+# Cache de transcripciones: la misma grabación reenviada (reintentos, recargas)
+# no vuelve a pagar una llamada a Whisper.
+transcription_cache = TTLCache(
+    'transcribe',
+    max_entries=int(os.getenv('TRANSCRIBE_CACHE_MAX_ENTRIES', 256)),
+    ttl_seconds=float(os.getenv('TRANSCRIBE_CACHE_TTL', 6 * 3600)),
+    disk_dir=os.getenv('TRANSCRIBE_CACHE_DIR', ''),
+    max_disk_entries=int(os.getenv('TRANSCRIBE_CACHE_MAX_DISK_ENTRIES', 0)) or None
+)
+
+# Calculate absolute path to frontend/assets/icons
+ICONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'assets', 'icons')
+
+# Vocabulario fonético aprendido: letra inicial -> palabras validadas con icono.
+# Los niveles de fonemas se montan en local y el LLM solo amplía letras con poco vocabulario.
+vocabulary = None
+if os.getenv('VOCAB_INDEX', '1') == '1':
+    vocabulary = VocabularyIndex(
+        os.getenv('VOCAB_INDEX_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'vocabulary_index.json'),
+        ICONS_DIR,
+        min_pool=int(os.getenv('VOCAB_MIN_POOL', 8))
+    )
+
+# Cache de audio TTS (MP3 en base64): las mismas frases de los juegos se repiten mucho
+tts_cache = TTLCache(
+    'tts',
+    max_entries=int(os.getenv('TTS_CACHE_MAX_ENTRIES', 128)),
+    ttl_seconds=float(os.getenv('TTS_CACHE_TTL', 24 * 3600))
+)
+
+# Variantes rasterizadas de los iconos (PNG/WebP a tamaños fijos) para dispositivos lentos
+icons = icon_variants.IconVariants(
+    ICONS_DIR,
+    os.getenv('ICON_VARIANTS_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'icon_variants')
+)
 
 def check_icon(word):
-    # Calculate absolute path to frontend/assets/icons
-    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    icons_dir = os.path.join(base_dir, 'frontend', 'assets', 'icons')
-    
-    if not os.path.exists(icons_dir):
-        os.makedirs(icons_dir, exist_ok=True)
+    if not os.path.exists(ICONS_DIR):
+        os.makedirs(ICONS_DIR, exist_ok=True)
 
-    file_path = os.path.join(icons_dir, f"{word}.svg")
+    file_path = os.path.join(ICONS_DIR, f"{word}.svg")
 
     if not os.path.exists(file_path):
-        print(f"🎨 Icon not found for '{word}', generating at: {file_path}")
-        generate_svg_with_llm(word, file_path)
+        logger.info(f"🎨 Icon not found for '{word}', generating at: {file_path}", extra={'sample': True})
+        if not lazy_import('generate_assets').generate_svg_with_llm(word, file_path):
+            return
+
+    icons.schedule(word)
+
+# Estado caliente que sobrevive a reinicios (snapshot periódico y al apagar), por prioridad
+warm_snapshot.register_section('tts', tts_cache.export_entries, tts_cache.import_entries)
+warm_snapshot.register_section('transcribe', transcription_cache.export_entries, transcription_cache.import_entries)
+warm_snapshot.register_section('idempotency', idempotency_store.export_entries, idempotency_store.import_entries)
+if vocabulary is not None:
+    warm_snapshot.register_section('vocabulary', vocabulary.export_letters, vocabulary.merge)
+
+# Imports pesados fuera del arranque: se cargan en segundo plano tras abrir el puerto
+# (o en el primer uso si WARMUP_ON_START=0)
+for _module in ('requests', 'gtts', 'generate_assets'):
+    register_warmup(f'import:{_module}', lambda name=_module: lazy_import(name))
 
 # ==================== MODELS ====================
 
@@ -60,16 +186,16 @@ class TTSRequest(BaseModel):
     speed: float = Field(default=1.0, ge=0.5, le=2.0)
 
 class ChatRequest(BaseModel):
-    messages: list
-    model: str = Field(default='openai/gpt-oss-120b')
-    temperature: float = Field(default=0.7, ge=0, le=2)
-    max_tokens: int = Field(default=1024, ge=1, le=8000)
+    messages: List[ChatMessage] = Field(..., min_length=1, max_length=MAX_MESSAGES)
+    model: Optional[str] = Field(default=None, description="Por defecto, el modelo de la ruta 'chat'")
+    temperature: Optional[float] = Field(default=None, ge=0, le=2)
+    max_tokens: Optional[int] = Field(default=None, ge=1, le=8000)
 
 class GenerateRequest(BaseModel):
     prompt: str = Field(..., min_length=1, max_length=2000)
-    model: str = Field(default='openai/gpt-oss-120b')
-    temperature: float = Field(default=0.7, ge=0, le=2)
-    max_tokens: int = Field(default=1024, ge=1, le=8000)
+    model: Optional[str] = Field(default=None, description="Por defecto, el modelo de la ruta 'generate'")
+    temperature: Optional[float] = Field(default=None, ge=0, le=2)
+    max_tokens: Optional[int] = Field(default=None, ge=1, le=8000)
 
 # ==================== HEALTH CHECK ====================
 
@@ -79,92 +205,243 @@ async def health():
         'ok': True,
         'service': 'eduplay-backend',
         'version': '1.0.0',
-        'groq_configured': bool(GROQ_API_KEY),
+        'groq_configured': bool(groq_keys),
+        'groq_keys': len(groq_keys),
+        'ready': ready.is_set(),
         'endpoints': {
             'transcribe': '/transcribe',
             'tts': '/tts',
-            'chat': '/chat'
+            'chat': '/chat',
+            'speaking_session': '/ws/speaking',
+            'icons': '/icons/{name}'
         }
     }
 
+@app.get('/ready')
+async def readiness():
+    """
+    Readiness: 503 hasta que los imports diferidos y caches estén calientes
+    """
+    body = startup_report()
+    return Response(
+        content=json.dumps(body),
+        media_type='application/json',
+        status_code=200 if ready.is_set() else 503
+    )
+
+@app.get('/metrics/routes')
+async def model_routes_metrics():
+    """
+    Tabla de rutas por tarea con latencia y tokens por modelo
+    """
+    return routes_snapshot()
+
+@app.get('/metrics/vocabulary')
+async def vocabulary_metrics():
+    """
+    Tamaño del vocabulario por letra y niveles servidos en local
+    """
+    return vocabulary.snapshot_stats() if vocabulary is not None else {'enabled': False}
+
+@app.get('/metrics/idempotency')
+async def idempotency_metrics():
+    """
+    Respuestas guardadas/reproducidas por Idempotency-Key
+    """
+    return {**idempotency_stats, 'store': idempotency_store.snapshot_stats()}
+
+@app.get('/metrics/groq-keys')
+async def groq_key_metrics():
+    """
+    Uso y margen de rate limit por API key de Groq (keys enmascaradas)
+    """
+    return groq_keys.snapshot()
+
+@app.get('/metrics/http')
+async def http_metrics():
+    """
+    Respuestas comprimidas (bytes antes/después) y 304 servidos
+    """
+    return http_caching_stats
+
+@app.get('/metrics/prefetch')
+async def prefetch_metrics():
+    """
+    Aciertos/fallos del prefetch especulativo de niveles
+    """
+    return level_prefetch.snapshot_stats()
+
+@app.get('/metrics/bodies')
+async def body_metrics():
+    """
+    Cuerpos rechazados con 413 por ruta y memoria pico de la lectura de audio
+    """
+    return {**body_limit_stats, 'audio': audio_payload_stats, 'process_max_rss_kib': _max_rss_kib()}
+
+def _max_rss_kib():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+@app.get('/metrics/icons')
+async def icon_metrics():
+    """
+    Variantes rasterizadas generadas/servidas
+    """
+    return icons.snapshot_stats()
+
+# ==================== ICONS ====================
+
+@app.get('/icons/{name}')
+async def icon(name: str, request: Request, size: int = 128, fmt: Optional[str] = Query(None, alias='format')):
+    """
+    Icono pre-rasterizado al tamaño más cercano (png | webp | svg). Sin 'format'
+    se elige WebP si el navegador lo acepta. Mientras la variante no exista se
+    sirve el SVG y se encola su generación.
+    """
+    name = name.lower()
+    if not icon_variants.valid_name(name) or not os.path.exists(icons.svg_path(name)):
+        raise HTTPException(status_code=404, detail="Icon not found")
+
+    fmt = (fmt or ('webp' if 'image/webp' in request.headers.get('accept', '') else 'png')).lower()
+    headers = {'Cache-Control': 'public, max-age=86400'}
+    if fmt != 'svg':
+        variant_size = icon_variants.pick_size(size)
+        path = icons.lookup(name, variant_size, fmt)
+        if path:
+            icon_variants.stats['served'] += 1
+            return FileResponse(path, media_type=icon_variants.MEDIA_TYPES[fmt],
+                                headers={**headers, 'X-Icon-Variant': f"{variant_size}.{fmt}"})
+        icons.schedule(name)
+        icon_variants.stats['svg_fallback'] += 1
+
+    # .svg.br / .svg.gz junto al SVG si existen (el middleware no vuelve a comprimir)
+    path, encoding = precompressed(icons.svg_path(name), request.headers.get('accept-encoding'))
+    headers.update({'X-Icon-Variant': 'svg', 'Vary': 'Accept-Encoding'})
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return FileResponse(path, media_type='image/svg+xml', headers=headers)
+
 # ==================== TRANSCRIPTION (WHISPER via GROQ) ====================
 
-@app.post('/transcribe')
-async def transcribe(request: TranscribeRequest):
+@app.post('/transcribe', openapi_extra={'requestBody': {
+    'required': True,
+    'content': {'application/json': {'schema': TranscribeRequest.model_json_schema()}}
+}})
+async def transcribe(request: Request):
     """
-    Transcribe audio usando Groq's Whisper API
+    Transcribe audio usando Groq's Whisper API. El cuerpo (TranscribeRequest) se lee
+    en streaming: el base64 se decodifica por trozos a un fichero temporal.
     """
-    if not GROQ_API_KEY:
+    if not groq_keys:
         raise HTTPException(
             status_code=503,
             detail="Groq API key no configurada"
         )
 
     try:
-        # Decodificar base64
-        audio_data = request.audio
-        if ',' in audio_data:
-            audio_data = audio_data.split(',')[1]
+        with stage('decode'):
+            fields, audio = await read_json_audio(request.stream())
+    except (ValueError, binascii.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Cuerpo de audio inválido: {e}")
 
-        audio_bytes = base64.b64decode(audio_data)
+    try:
+        if audio is None:
+            # Falta 'audio' (o no es texto): el mismo 422 que daría el modelo
+            TranscribeRequest.model_validate(fields)
+        params = TranscribeRequest.model_validate({**fields, 'audio': ''})
+    except ValidationError as e:
+        if audio is not None:
+            audio.close()
+        raise RequestValidationError(e.errors(include_url=False))
 
-        # Groq Whisper API requiere un archivo
-        # Crear un archivo temporal en memoria
-        files = {
-            'file': (f'audio.{request.format}', io.BytesIO(audio_bytes), f'audio/{request.format}')
-        }
+    try:
+        text, source = await _cached_transcription(audio, params.format, params.language)
 
-        data = {
+        if source != 'miss':
+            logger.info(f"♻️ Transcripción servida desde cache ({source})")
+
+        return {
+            'text': text,
+            'confidence': 0.95,  # Groq no devuelve confidence, usamos valor alto
+            'language': params.language,
             'model': 'whisper-large-v3',
-            'language': request.language,
-            'response_format': 'json'
+            'cached': source != 'miss',
+            'cache': source
         }
 
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}'
-        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"❌ Error en transcripción: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al transcribir audio: {str(e)}"
+        )
+    finally:
+        audio.close()
 
-        print(f"🎤 Enviando audio a Groq Whisper API...")
+async def _cached_transcription(audio, audio_format, language):
+    """
+    Transcribe via cache: `audio` is bytes (WebSocket) or a SpooledAudio
+    (/transcribe). Returns (text, source) with source 'miss' when Whisper
+    was actually called.
+    """
+    cache_key = fingerprint(audio_digest(audio), language)
+
+    async def run_whisper():
+        return await asyncio.to_thread(_whisper_transcribe, audio, audio_format, language)
+
+    return await transcription_cache.get_or_compute(cache_key, run_whisper)
 
-        response = requests.post(
+def _whisper_transcribe(audio, audio_format, language):
+    """
+    Llamada bloqueante a Groq Whisper (se ejecuta en un thread).
+    """
+    # Groq Whisper API requiere un archivo
+    # Crear un archivo temporal en memoria
+    data = {
+        'model': 'whisper-large-v3',
+        'language': language,
+        'response_format': 'json'
+    }
+
+    def send(api_key):
+        # Archivo desde el principio en cada intento: un reintento con otra key vuelve a leerlo
+        fileobj = io.BytesIO(audio) if isinstance(audio, bytes) else audio.rewind()
+        files = {
+            'file': (f'audio.{audio_format}', fileobj, f'audio/{audio_format}')
+        }
+        return cassette.post(
+            'whisper',
             f'{GROQ_API_URL}/audio/transcriptions',
-            headers=headers,
+            headers={'Authorization': f'Bearer {api_key}'},
             files=files,
             data=data,
             timeout=30
         )
 
-        if not response.ok:
-            error_detail = response.text
-            print(f"❌ Error de Groq: {response.status_code} - {error_detail}")
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Error de Groq API: {error_detail}"
-            )
+    logger.info("🎤 Enviando audio a Groq Whisper API...", extra={"audio_bytes": len(audio)})
 
-        result = response.json()
-        text = result.get('text', '').strip()
+    with stage('upstream'):
+        response = groq_keys.call(send)
 
-        print(f"✅ Transcripción exitosa: {text[:100]}...")
-
-        return {
-            'text': text,
-            'confidence': 0.95,  # Groq no devuelve confidence, usamos valor alto
-            'language': request.language,
-            'model': 'whisper-large-v3'
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"❌ Error en transcripción: {e}")
-        import traceback
-        traceback.print_exc()
+    if not response.ok:
+        error_detail = response.text
+        logger.error(f"❌ Error de Groq: {response.status_code}", extra={"upstream_detail": error_detail})
         raise HTTPException(
-            status_code=500,
-            detail=f"Error al transcribir audio: {str(e)}"
+            status_code=response.status_code,
+            detail=f"Error de Groq API: {error_detail}"
         )
 
+    result = response.json()
+    text = result.get('text', '').strip()
+
+    logger.info(f"✅ Transcripción exitosa: {text[:100]}...")
+    return text
+
 # ==================== TEXT-TO-SPEECH ====================
 
 @app.post('/tts')
@@ -173,22 +450,14 @@ async def text_to_speech(request: TTSRequest):
     Convierte texto a voz usando gTTS
     """
     try:
-        tts = gTTS(
-            text=request.text,
-            lang=request.language,
-            slow=(request.speed < 0.9)
-        )
-
-        mp3_buffer = io.BytesIO()
-        tts.write_to_fp(mp3_buffer)
-        mp3_buffer.seek(0)
-        audio_bytes = mp3_buffer.getvalue()
+        audio_bytes, source = await _cached_speech(request.text, request.language, request.speed < 0.9)
 
         return Response(
             content=audio_bytes,
             media_type='audio/mp3',
             headers={
                 'X-Audio-Model': 'gTTS',
+                'X-Cache': source,
                 'Access-Control-Allow-Origin': '*'
             }
         )
@@ -198,49 +467,68 @@ async def text_to_speech(request: TTSRequest):
             detail=f'Error TTS: {str(e)}'
         )
 
+async def _cached_speech(text, language, slow=False):
+    """
+    gTTS via cache: returns (mp3_bytes, source).
+    """
+    async def synthesize():
+        audio = await asyncio.to_thread(_synthesize_speech, text, language, slow)
+        return base64.b64encode(audio).decode('ascii')
+
+    encoded, source = await tts_cache.get_or_compute(fingerprint(text, language, str(bool(slow))), synthesize)
+    return base64.b64decode(encoded), source
+
+def _synthesize_speech(text, language, slow=False):
+    """
+    Llamada bloqueante a gTTS, devuelve los bytes MP3.
+    """
+    def synthesize():
+        tts = lazy_import('gtts').gTTS(text=text, lang=language, slow=slow)
+
+        mp3_buffer = io.BytesIO()
+        tts.write_to_fp(mp3_buffer)
+        return mp3_buffer.getvalue()
+
+    with stage('synthesis'):
+        return cassette.call_bytes('gtts', [text, language, slow], synthesize)
+
 # ==================== CHAT (GROQ LLM) ====================
 
 @app.post('/chat')
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response):
     """
-    Chat completion usando Groq API
+    Chat completion usando Groq API. Si el historial supera CHAT_CONTEXT_TOKENS
+    (estimado en local) los turnos más antiguos se resumen/recortan antes de enviarlo.
     """
-    if not GROQ_API_KEY:
+    if not groq_keys:
         raise HTTPException(
             status_code=503,
             detail="Groq API key no configurada"
         )
 
     try:
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-
-        payload = {
-            'model': request.model,
-            'messages': request.messages,
-            'temperature': request.temperature,
-            'max_tokens': request.max_tokens
-        }
+        messages, budget = fit_to_budget([m.model_dump(exclude_none=True) for m in request.messages])
+    except ContextBudgetExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if budget['trimmed_turns']:
+        logger.info(f"✂️ Chat history trimmed: {budget['trimmed_turns']} turns", extra={"context_budget": budget})
+    response.headers['X-Context-Tokens'] = str(budget['estimated_tokens'])
+    response.headers['X-Context-Trimmed'] = str(budget['trimmed_turns'])
 
-        response = requests.post(
-            f'{GROQ_API_URL}/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=30
+    try:
+        result, _ = await asyncio.to_thread(
+            chat_completion, 'chat', messages, GROQ_API_URL, groq_keys,
+            model=request.model,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens
         )
+        return result
 
-        if not response.ok:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Error de Groq API: {response.text}"
-            )
-
-        return response.json()
-
-    except HTTPException:
-        raise
+    except UpstreamError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Error de Groq API: {e.detail}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -254,51 +542,33 @@ async def generate(request: GenerateRequest):
     """
     Generación de texto usando Groq API (compatible con frontend)
     """
-    if not GROQ_API_KEY:
+    if not groq_keys:
         raise HTTPException(
             status_code=503,
             detail="Groq API key no configurada"
         )
 
     try:
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-
-        payload = {
-            'model': request.model,
-            'messages': [
-                {'role': 'user', 'content': request.prompt}
-            ],
-            'temperature': request.temperature,
-            'max_tokens': request.max_tokens
-        }
-
-        response = requests.post(
-            f'{GROQ_API_URL}/chat/completions',
-            headers=headers,
-            json=payload,
-            timeout=30
+        result, model = await asyncio.to_thread(
+            chat_completion, 'generate', [{'role': 'user', 'content': request.prompt}],
+            GROQ_API_URL, groq_keys,
+            model=request.model,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens
         )
-
-        if not response.ok:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Error de Groq API: {response.text}"
-            )
-
-        result = response.json()
         text = result['choices'][0]['message']['content']
 
         return {
             'text': text,
-            'model': request.model,
+            'model': model,
             'usage': result.get('usage', {})
         }
 
-    except HTTPException:
-        raise
+    except UpstreamError as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Error de Groq API: {e.detail}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -307,160 +577,207 @@ async def generate(request: GenerateRequest):
 
 # ==================== DYNAMIC LEVEL GENERATION ====================
 
+# Rondas máximas de reparación parcial cuando faltan items válidos
+LEVEL_REPAIR_ROUNDS = int(os.getenv('LEVEL_REPAIR_ROUNDS', 1))
+
 class GenerateLevelRequest(BaseModel):
     gameType: str = Field(..., description="Type of game: math, phoneme, dictation")
     difficulty: str = Field(default="easy", description="easy, medium, hard")
     limit: int = Field(default=5, ge=1, le=10)
     target: Optional[str] = Field(default=None, description="Target phoneme or concept")
     performance_context: Optional[dict] = Field(default=None, description="Recent stats: {accuracy, avg_time, mistakes}")
+    session_id: Optional[str] = Field(default=None, max_length=128, description="Child session: enables next-level prefetch")
+
+# Letras por defecto cuando no hay target ni errores
+DEFAULT_TARGETS = ['M', 'P', 'S', 'L', 'T']
+
+# Siguiente nivel especulativo por sesión (PREFETCH_ENABLED, PREFETCH_TTL, PREFETCH_MAX_SESSIONS)
+level_prefetch = LevelPrefetcher()
+# Niveles ya generados y sin servir: tras un reinicio la siguiente petición de la sesión los recibe sin LLM
+warm_snapshot.register_section(
+    'levels', level_prefetch.export_entries,
+    lambda entries: level_prefetch.import_entries(entries, GenerateLevelRequest.model_validate)
+)
 
 @app.post('/api/generate-levels')
 async def generate_levels(request: GenerateLevelRequest):
     """
     Generates dynamic game levels using Groq
     """
-    if not GROQ_API_KEY:
-        raise HTTPException(status_code=503, detail="Groq API key missing")
+    # Con cassettes no hay prefetch: sus llamadas especulativas no están grabadas y alteran la secuencia aleatoria
+    prefetch = bool(request.session_id) and os.getenv('PREFETCH_ENABLED', '1') == '1' and cassette.mode() == 'off'
+
+    result = None
+    if prefetch:
+        result = await level_prefetch.take(request.session_id, request, DEFAULT_TARGETS)
+        if result is not None:
+            logger.info("⚡ Level served from prefetch")
+            result = {**result, 'prefetched': True}
+    if result is None:
+        result = await _build_level(request)
+
+    if prefetch and result.get('levels'):
+        level_prefetch.schedule(request.session_id, _predict_next_request(request, result), _build_level)
+    return result
+
+def _predict_next_request(request, result):
+    """
+    Likely follow-up: same game parameters and, for phonemes, the letter just
+    served (game-manager.js sends it back as target) with the same context.
+    """
+    update = {'session_id': None}
+    if request.gameType == 'phoneme' and result.get('target'):
+        update['target'] = result['target']
+    return request.model_copy(update=update)
 
+async def _build_level(request):
+    """
+    Builds one level (vocabulary index or LLM); shared by the endpoint and the prefetcher.
+    """
     prompt = ""
     if request.gameType == 'math':
-        prompt = f"""
-        Generate {request.limit} {request.difficulty} math problems for a 5-7 year old. 
-        Operations: Addition/Subtraction.
-        Format: JSON Array only.
-        Example: [{{"q": "2 + 2", "a": 4, "ops": "+"}}]
-        Response must be ONLY valid JSON.
-        """
+        prompt = math_level_prompt(request.difficulty, request.limit)
     elif request.gameType == 'phoneme':
         context_str = ""
         if request.performance_context:
             context_str = f" Recent results: {request.performance_context.get('accuracy')}% accuracy, {request.performance_context.get('avg_time')}s avg time."
 
         target_phoneme = request.target
+        mistakes = request.performance_context.get('mistakes', []) if request.performance_context else []
         
         # Priority 1: Explicit target from request
         if not target_phoneme:
             # Priority 2: Mistakes from context
-            mistakes = request.performance_context.get('mistakes', []) if request.performance_context else []
             if mistakes:
                 import random
                 target_phoneme = random.choice(mistakes)
-                print(f"🎯 Creating remedial level for mistake: {target_phoneme}")
+                logger.info(f"🎯 Creating remedial level for mistake: {target_phoneme}")
         
         # Priority 3: Random default (handled by AI if still None, or picking one here)
         if not target_phoneme:
              # Let's pick a common starter letter to be safe/consistent if AI decides bad
              import random
-             target_phoneme = random.choice(['M', 'P', 'S', 'L', 'T'])
-
-        target_instruction = f"ALL correct words MUST start with the Spanish letter '{target_phoneme}'."
-        distractor_instruction = f"Generate 1-3 distractor words that do NOT start with '{target_phoneme}'."
-        
-        prompt = f"""
-        Generate a phoneme identification game level in Spanish.
-        Target Phoneme: "{target_phoneme}"
-        {target_instruction}
-        {distractor_instruction}
-        
-        Return exactly {request.limit} items total (including the distractor).
-        Structure:
-        [
-          {{ "word": "Mesa", "icon": "mesa", "isTarget": true }},
-          {{ "word": "Sol", "icon": "sol", "isTarget": false }}
-        ]
-        
-        CRITICAL: 
-        1. "isTarget" must be true ONLY for words starting with '{target_phoneme}'.
-        2. "isTarget" must be false for the distractor.
-        3. Simple vocabulary for a 5-7 year-old.
-        4. Do NOT use words containing the letter "Ñ" (e.g. avoid Niña, Piña).
-        5. Response must be ONLY valid JSON array.
-        """
+             target_phoneme = random.choice(DEFAULT_TARGETS)
+
+        # Nivel montado en local desde el vocabulario (sin LLM) si la letra tiene suficientes palabras
+        if vocabulary is not None:
+            with stage('index'):
+                local_level = vocabulary.assemble(target_phoneme, request.limit, mistakes)
+            if local_level:
+                with stage('icon'):
+                    # Generar un icono es bloqueante (LLM): fuera del event loop, también en el prefetch
+                    for item in local_level:
+                        await asyncio.to_thread(check_icon, item['icon'])
+                logger.info(f"📚 Level for '{target_phoneme}' assembled from vocabulary index")
+                return {"levels": local_level, "source": "index", "target": target_phoneme}
+
+        prompt = phoneme_level_prompt(target_phoneme, request.limit)
     else:
          raise HTTPException(status_code=400, detail="Unknown game type")
 
-    try:
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
+    if not groq_keys:
+        raise HTTPException(status_code=503, detail="Groq API key missing")
+
+    async def complete(level_prompt):
         # Enforce JSON mode if supported or just via prompt
-        payload = {
-            'model': 'openai/gpt-oss-120b',
-            'messages': [{'role': 'user', 'content': prompt}],
-            'temperature': 0.7,
-            'response_format': {"type": "json_object"} 
-        }
+        try:
+            result, _ = await asyncio.to_thread(
+                chat_completion, f'{request.gameType}-levels', [{'role': 'user', 'content': level_prompt}],
+                GROQ_API_URL, groq_keys,
+                extra={'response_format': {"type": "json_object"}}
+            )
+        except UpstreamError as e:
+             raise HTTPException(status_code=e.status_code, detail=e.detail)
+        return result['choices'][0]['message']['content']
 
-        response = requests.post(f'{GROQ_API_URL}/chat/completions', headers=headers, json=payload, timeout=30)
-        
-        if not response.ok:
-             raise HTTPException(status_code=response.status_code, detail=response.text)
+    def parse(content):
+        with stage('parse'):
+            return parse_level_items(content)
+
+    def validate(items, stats=None):
+        with stage('validation'):
+            if request.gameType == 'phoneme':
+                return validate_phoneme_level(items, target_phoneme, request.limit, stats)
+            return validate_math_level(items, request.limit, stats)
 
-        result = response.json()
-        content = result['choices'][0]['message']['content']
+    try:
+        content = await complete(prompt)
         
-        # Parse JSON from content
-        import json
         try:
-            # Llama sometimes wraps in ```json ... ```
-            clean_content = content.replace("```json", "").replace("```", "").strip()
-            data = json.loads(clean_content)
-            
-            # If wrapped in object key usually "levels" or "items"
-            if isinstance(data, dict):
-                # Try to find list values
-                for k, v in data.items():
-                    if isinstance(v, list):
-                        data = v
-                        break
-            
-            # If still dict and no list found, might be single object?
-            if not isinstance(data, list):
-                if isinstance(data, dict):
-                     # Maybe raw wrapper?
-                     pass 
-                else: 
-                     data = []
-            if isinstance(data, list):
-                valid_data = []
-                for item in data:
-                    word = item.get('word')
-                    # Validation: Filter out None, empty strings, string "None", or containing 'ñ'
-                    if not word or str(word).lower() == 'none' or str(word).lower() == 'null' or 'ñ' in str(word).lower():
-                        continue
-                    
-                    item['word'] = str(word) # Ensure string
-                    check_icon(item['word'].lower())
-                    valid_data.append(item)
-                
-                data = valid_data
-            
-            print(f"✅ Generated {len(data)} valid levels")
-            return {"levels": data}
-        except Exception as e:
-            print(f"JSON Parse Error: {e} - Content: {content}")
+            data, stats = validate(parse(content))
+        except ValueError as e:
+            # El contenido completo puede ser enorme: el formatter lo recorta
+            logger.warning(f"JSON Parse Error: {e}", extra={"content": content})
             return {"levels": [], "error": "Failed to parse AI response"}
 
+        # Reparación parcial: se piden solo los items que faltan, no el nivel entero
+        while len(data) < request.limit and stats['repair_rounds'] < LEVEL_REPAIR_ROUNDS:
+            stats['repair_rounds'] += 1
+            before = len(data)
+            if request.gameType == 'phoneme':
+                repair_prompt = phoneme_repair_prompt(data, target_phoneme, request.limit)
+            else:
+                repair_prompt = math_repair_prompt(data, request.difficulty, request.limit)
+            content = await complete(repair_prompt)
+            try:
+                extra_items = parse(content)
+            except ValueError as e:
+                logger.warning(f"Repair Parse Error: {e}", extra={"content": content})
+                break
+            data, stats = validate(data + extra_items, {**stats, 'received': stats['received'] - before})
+            stats['repaired_items'] += len(data) - before
+
+        if request.gameType == 'phoneme':
+            with stage('icon'):
+                for item in data:
+                    await asyncio.to_thread(check_icon, item['word'].lower())
+
+            # Las palabras validadas amplían el vocabulario de la letra (reescribe el JSON: en un hilo)
+            if vocabulary is not None:
+                await asyncio.to_thread(vocabulary.ingest, data, target_phoneme)
+        
+        logger.info(f"✅ Generated {len(data)} valid levels", extra={"validation": stats})
+        result = {"levels": data, "source": "llm", "validation": stats}
+        if request.gameType == 'phoneme':
+            result["target"] = target_phoneme
+        return result
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 class SpeakingChatRequest(BaseModel):
-    message: str
+    message: str = Field(..., max_length=MAX_MESSAGE_CHARS)
     context: Optional[str] = None
 
+SPEAKING_FALLBACK_REPLY = "¡Qué bien suena eso!"
+
 @app.post('/api/speaking-chat')
 async def speaking_chat(request: SpeakingChatRequest):
     """
     Returns a short (max 4 words) conversational response to child's speech.
     """
-    if not GROQ_API_KEY:
+    if not groq_keys:
         raise HTTPException(status_code=503, detail="Groq API key missing")
 
+    try:
+        content = await asyncio.to_thread(_speaking_reply, request.message)
+        return {"reply": content}
+
+    except Exception as e:
+        logger.warning(f"Speaking Chat Error: {e}")
+        return {"reply": SPEAKING_FALLBACK_REPLY}
+
+def _speaking_reply(message):
+    """
+    Blocking Groq call for the speaking game reply (runs in a thread).
+    """
+    # Prompt acotado: una transcripción larga no debe encarecer ni ralentizar el turno
+    message = truncate_to_tokens(message, int(os.getenv('SPEAKING_MESSAGE_TOKENS', 60)))
     prompt = f"""
     You are a friendly AI companion for a 5-year-old child. 
-    The child says: "{request.message}"
+    The child says: "{message}"
     Respond in Spanish. 
     CRITICAL RULES:
     1. DO NOT repeat what the child said.
@@ -470,37 +787,15 @@ async def speaking_chat(request: SpeakingChatRequest):
     Response:
     """
 
-    try:
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
-        
-        payload = {
-            'model': 'openai/gpt-oss-120b',
-            'messages': [{'role': 'user', 'content': prompt}],
-            'temperature': 0.8,
-            'max_tokens': 20
-        }
-
-        response = requests.post(f'{GROQ_API_URL}/chat/completions', headers=headers, json=payload, timeout=20)
-        
-        if not response.ok:
-             raise HTTPException(status_code=response.status_code, detail=response.text)
-
-        result = response.json()
-        content = result['choices'][0]['message']['content'].strip().strip('"')
-        
-        # Enforce 4 word limit just in case
-        words = content.split()
-        if len(words) > 4:
-            content = " ".join(words[:4]) + "!"
+    result, _ = chat_completion('speaking-chat', [{'role': 'user', 'content': prompt}], GROQ_API_URL, groq_keys)
+    content = result['choices'][0]['message']['content'].strip().strip('"')
+    
+    # Enforce 4 word limit just in case
+    words = content.split()
+    if len(words) > 4:
+        content = " ".join(words[:4]) + "!"
 
-        return {"reply": content}
-
-    except Exception as e:
-        print(f"Speaking Chat Error: {e}")
-        return {"reply": "¡Qué bien suena eso!"}
+    return content
 
 @app.options("/api/speaking-chat")
 async def speaking_chat_options():
@@ -524,6 +819,163 @@ async def generate_levels_options():
         }
     )
 
+# ==================== SPEAKING SESSION (WEBSOCKET) ====================
+
+WS_MAX_TURN_BYTES = int(os.getenv('WS_MAX_TURN_BYTES', 10 * 1024 * 1024))
+
+class SpeakingSessionSettings(BaseModel):
+    # Formatos que acepta Whisper en Groq
+    format: Literal['wav', 'webm', 'mp3', 'mp4', 'mpeg', 'mpga', 'm4a', 'ogg', 'opus', 'flac'] = 'wav'
+    language: str = Field(default='es', pattern=r'^[a-z]{2,3}(-[A-Za-z]{2})?$')
+    speed: float = Field(default=1.0, ge=0.5, le=2.0)
+
+@app.websocket('/ws/speaking')
+async def speaking_session(websocket: WebSocket):
+    """
+    Persistent session for the speaking game: one connection, one exchange per turn.
+
+    Client -> server:
+      {"type": "start", "language": "es", "format": "wav", "speed": 1.0}  (optional, any time)
+      <binary frames>            audio chunks of the current turn
+      {"type": "end"}            closes the turn and queues it for processing
+      {"type": "text", "message": "..."}  turn already transcribed on the device
+    Server -> client (per turn):
+      {"type": "transcript", "turn", "text", "cached"}
+      {"type": "reply", "turn", "text"}
+      {"type": "audio", "turn", "format": "mp3", "bytes"} followed by one binary frame
+      {"type": "done", "turn", "timings"} or {"type": "error", "turn", "detail"}
+
+    Turns are processed in order by a worker while the next turn keeps
+    streaming in, and TTS starts as soon as the reply text exists.
+    """
+    await websocket.accept()
+
+    if not groq_keys:
+        await websocket.send_json({'type': 'error', 'turn': None, 'detail': 'Groq API key missing'})
+        await websocket.close(code=1011)
+        return
+
+    settings = SpeakingSessionSettings()
+    turns = asyncio.Queue()
+    send_lock = asyncio.Lock()
+
+    async def send_json(message):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def process_turns():
+        while True:
+            turn = await turns.get()
+            if turn is None:
+                return
+            try:
+                await _run_speaking_turn(turn, send_json, websocket, send_lock)
+            except WebSocketDisconnect:
+                return
+            except Exception as e:
+                logger.exception(f"❌ Speaking session turn {turn['turn']} failed: {e}")
+                await send_json({'type': 'error', 'turn': turn['turn'], 'detail': str(e)})
+
+    worker = asyncio.create_task(process_turns())
+    chunks = []
+    received = 0
+    discarding = False  # turno que pasó de WS_MAX_TURN_BYTES: se ignora hasta su "end"
+    turn_number = 0
+
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame['type'] == 'websocket.disconnect':
+                break
+
+            if frame.get('bytes') is not None:
+                if discarding:
+                    continue
+                received += len(frame['bytes'])
+                if received > WS_MAX_TURN_BYTES:
+                    await send_json({'type': 'error', 'turn': turn_number + 1, 'detail': 'Audio demasiado grande'})
+                    chunks, received, discarding = [], 0, True
+                    continue
+                chunks.append(frame['bytes'])
+                continue
+
+            try:
+                message = json.loads(frame.get('text') or '{}')
+            except ValueError:
+                await send_json({'type': 'error', 'turn': None, 'detail': 'Invalid JSON frame'})
+                continue
+
+            kind = message.get('type')
+            if kind == 'start':
+                update = {key: message[key] for key in SpeakingSessionSettings.model_fields if key in message}
+                try:
+                    settings = SpeakingSessionSettings(**{**settings.model_dump(), **update})
+                except ValidationError as e:
+                    await send_json({'type': 'error', 'turn': None,
+                                     'detail': f"Invalid start settings: {e.errors(include_url=False)}"})
+            elif kind == 'end':
+                if discarding:
+                    # El turno descartado consume su número (el error ya se envió con él)
+                    turn_number += 1
+                    discarding = False
+                    continue
+                if not chunks:
+                    await send_json({'type': 'error', 'turn': None, 'detail': 'Turno sin audio'})
+                    continue
+                turn_number += 1
+                await turns.put({'turn': turn_number, 'audio': b''.join(chunks), 'text': None, **settings.model_dump()})
+                chunks, received = [], 0
+            elif kind == 'text' and message.get('message'):
+                turn_number += 1
+                await turns.put({'turn': turn_number, 'audio': None, 'text': message['message'], **settings.model_dump()})
+            else:
+                await send_json({'type': 'error', 'turn': None, 'detail': f'Unknown message type: {kind}'})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await turns.put(None)
+        if websocket.client_state == WebSocketState.DISCONNECTED:
+            worker.cancel()
+        try:
+            await worker
+        except (asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+            pass
+
+async def _run_speaking_turn(turn, send_json, websocket, send_lock):
+    timings = {}
+    started = time.perf_counter()
+
+    text = turn['text']
+    if text is None:
+        text, source = await _cached_transcription(turn['audio'], turn['format'], turn['language'])
+        timings['transcribe_ms'] = round((time.perf_counter() - started) * 1000)
+        await send_json({'type': 'transcript', 'turn': turn['turn'], 'text': text, 'cached': source != 'miss'})
+
+    stage_started = time.perf_counter()
+    try:
+        reply = await asyncio.to_thread(_speaking_reply, text)
+    except Exception as e:
+        logger.warning(f"Speaking Chat Error: {e}")
+        reply = SPEAKING_FALLBACK_REPLY
+    timings['reply_ms'] = round((time.perf_counter() - stage_started) * 1000)
+
+    # La síntesis arranca antes de enviar el texto de respuesta
+    stage_started = time.perf_counter()
+    synthesis = asyncio.create_task(
+        _cached_speech(reply, turn['language'], float(turn['speed']) < 0.9)
+    )
+    await send_json({'type': 'reply', 'turn': turn['turn'], 'text': reply})
+
+    audio, _ = await synthesis
+    timings['tts_ms'] = round((time.perf_counter() - stage_started) * 1000)
+
+    async with send_lock:
+        await websocket.send_json({'type': 'audio', 'turn': turn['turn'], 'format': 'mp3', 'bytes': len(audio)})
+        await websocket.send_bytes(audio)
+
+    timings['total_ms'] = round((time.perf_counter() - started) * 1000)
+    await send_json({'type': 'done', 'turn': turn['turn'], 'timings': timings})
+
 # ==================== CORS PREFLIGHT HANDLERS (Existing) ====================
 
 @app.options("/transcribe")
@@ -569,17 +1021,23 @@ async def generate_options():
         }
     )
 
+mark('module_loaded')
+
 # ==================== STARTUP ====================
 
 if __name__ == '__main__':
     import uvicorn
     # Usar PORT_PYTHON del .env, fallback a PORT, y luego a 5001
     port = int(os.getenv('PORT_PYTHON') or os.getenv('PORT', 5001))
-    print(f"🚀 Starting EduPlay Backend on port {port}")
-    print(f"📡 Groq API: {'✅ Configured' if GROQ_API_KEY else '❌ Not configured'}")
+    logger.info(f"🚀 Starting EduPlay Backend on port {port}")
+    logger.info(f"📡 Groq API: {'✅ Configured' if groq_keys else '❌ Not configured'}")
     uvicorn.run(
         app,
         host='0.0.0.0',
         port=port,
-        log_level="info"
+        log_level="info",
+        # Los logs de uvicorn pasan por el mismo handler JSON con cola;
+        # la línea de acceso la escribe RequestIdMiddleware
+        log_config=None,
+        access_log=False
     )
@@ -0,0 +1,260 @@
+import os
+import json
+import base64
+import codecs
+import hashlib
+import binascii
+import tempfile
+
+# Audio en base64 desde el cliente. /transcribe no carga el cuerpo JSON entero:
+# lo lee por trozos, decodifica el base64 sobre la marcha y guarda los bytes en
+# un SpooledTemporaryFile (RAM hasta AUDIO_SPOOL_BYTES, después disco).
+
+DATA_URL_PREFIX = 'data:'
+_JSON_WHITESPACE = ' \t\r\n'
+_DECODER = json.JSONDecoder()
+
+stats = {'requests': 0, 'spilled': 0, 'bytes_decoded': 0, 'peak_buffer_bytes': 0, 'last_peak_buffer_bytes': 0}
+
+
+def decode_audio(audio):
+    """
+    Base64 audio from the client -> bytes. Accepts a bare base64 string or a
+    data URL ('data:audio/wav;base64,....').
+    """
+    if ',' in audio:
+        audio = audio.split(',')[1]
+    return base64.b64decode(audio)
+
+
+def digest(audio):
+    """sha256 of the decoded audio (bytes or SpooledAudio), used for cache keys."""
+    return audio.digest if isinstance(audio, SpooledAudio) else hashlib.sha256(audio).digest()
+
+
+class SpooledAudio:
+    """Decoded audio kept in memory up to `spool_bytes` and on disk beyond that."""
+
+    def __init__(self, spool_bytes=None):
+        spool_bytes = spool_bytes if spool_bytes is not None else int(os.getenv('AUDIO_SPOOL_BYTES', 1024 * 1024))
+        self.spool_bytes = spool_bytes
+        self.file = tempfile.SpooledTemporaryFile(max_size=spool_bytes, dir=os.getenv('AUDIO_SPOOL_DIR') or None)
+        self.size = 0
+        self._sha = hashlib.sha256()
+
+    def __len__(self):
+        return self.size
+
+    def write(self, data):
+        if data:
+            self.file.write(data)
+            self._sha.update(data)
+            self.size += len(data)
+
+    @property
+    def digest(self):
+        return self._sha.digest()
+
+    @property
+    def spilled(self):
+        return self.file._rolled
+
+    @property
+    def memory_bytes(self):
+        return 0 if self.spilled else self.size
+
+    def rewind(self):
+        """The underlying file positioned at the start (for uploading it)."""
+        self.file.seek(0)
+        return self.file
+
+    def read(self):
+        return self.rewind().read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Base64StreamDecoder:
+    """
+    Incremental base64 decoding: feed() text pieces of any length and the
+    decoded bytes go to `sink` in 4-character aligned blocks. A leading
+    'data:...;base64,' prefix is skipped.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.carry = ''
+        self.prefix_checked = False
+
+    def feed(self, text):
+        data = self.carry + text
+        if not self.prefix_checked:
+            if len(data) < len(DATA_URL_PREFIX) and DATA_URL_PREFIX.startswith(data):
+                self.carry = data
+                return
+            if data.startswith(DATA_URL_PREFIX):
+                comma = data.find(',')
+                if comma < 0:
+                    self.carry = data
+                    return
+                data = data[comma + 1:]
+            self.prefix_checked = True
+        if not data.isascii() or any(c in data for c in _JSON_WHITESPACE):
+            data = ''.join(data.split())
+        usable = len(data) - len(data) % 4
+        if usable:
+            self.sink.write(base64.b64decode(data[:usable]))
+        self.carry = data[usable:]
+
+    def finish(self):
+        if not self.prefix_checked and self.carry.startswith(DATA_URL_PREFIX):
+            raise binascii.Error('Data URL without payload')
+        if self.carry:
+            # Igual que b64decode con la cadena completa: un resto sin padding es un error
+            self.sink.write(base64.b64decode(self.carry))
+            self.carry = ''
+
+
+class _Reader:
+    """Text cursor over the async byte chunks of a request body."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks.__aiter__()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.peak = 0
+
+    async def fill(self):
+        if self.eof:
+            return False
+        try:
+            chunk = await self.chunks.__anext__()
+        except StopAsyncIteration:
+            self.eof = True
+            self.buf = self.buf[self.pos:] + self.utf8.decode(b'', final=True)
+            self.pos = 0
+            return False
+        self.buf = self.buf[self.pos:] + self.utf8.decode(chunk)
+        self.pos = 0
+        self.peak = max(self.peak, len(self.buf) + len(chunk))
+        return True
+
+    async def peek(self):
+        """Next non-whitespace character (not consumed), '' at the end of the body."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not await self.fill():
+                return ''
+
+    async def expect(self, char):
+        if await self.peek() != char:
+            raise ValueError(f"Invalid JSON body: expected '{char}'")
+        self.pos += 1
+
+    async def value(self, max_chars):
+        """A complete small JSON value (key, format, language...)."""
+        await self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buf, self.pos)
+                # Un número al final del buffer puede seguir en el siguiente trozo
+                if end < len(self.buf) or self.eof or isinstance(value, str):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ValueError("Invalid JSON body")
+            if len(self.buf) - self.pos > max_chars:
+                raise ValueError(f"JSON field longer than {max_chars} characters")
+            await self.fill()
+
+    async def stream_string(self, decoder):
+        """Feeds the JSON string at the cursor to `decoder` without holding all of it."""
+        await self.expect('"')
+        while True:
+            end = len(self.buf)
+            for stop in (self.buf.find('"', self.pos), self.buf.find('\\', self.pos)):
+                if stop >= 0:
+                    end = min(end, stop)
+            decoder.feed(self.buf[self.pos:end])
+            self.pos = end
+            if end < len(self.buf):
+                if self.buf[end] == '"':
+                    self.pos += 1
+                    return
+                while self.pos + 1 >= len(self.buf):
+                    if not await self.fill():
+                        raise ValueError("Invalid JSON body: unterminated string")
+                escaped = self.buf[self.pos + 1]
+                if escaped not in '/nrt':
+                    raise ValueError("Invalid character in base64 audio")
+                # '\/' es una '/' escapada; '\n' etc. son saltos de línea dentro del base64
+                decoder.feed('/' if escaped == '/' else '')
+                self.pos += 2
+            elif not await self.fill():
+                raise ValueError("Invalid JSON body: unterminated string")
+
+
+async def read_json_audio(chunks, field='audio', spool_bytes=None, max_field_chars=1024):
+    """
+    Parses a flat JSON object body from `chunks` (async iterable of bytes),
+    streaming the base64 string in `field` into a SpooledAudio. Returns
+    (other_fields, audio); audio is None when `field` is missing or not a
+    string (its raw value, if any, stays in other_fields). Raises ValueError
+    on malformed bodies and binascii.Error on invalid base64.
+    """
+    reader = _Reader(chunks)
+    audio = None
+    fields = {}
+    try:
+        await reader.expect('{')
+        if await reader.peek() == '}':
+            reader.pos += 1
+        else:
+            while True:
+                key = await reader.value(max_field_chars)
+                if not isinstance(key, str):
+                    raise ValueError("Invalid JSON body: keys must be strings")
+                await reader.expect(':')
+                if key == field and await reader.peek() == '"':
+                    if audio is not None:
+                        raise ValueError(f"Invalid JSON body: duplicate '{field}'")
+                    audio = SpooledAudio(spool_bytes)
+                    decoder = Base64StreamDecoder(audio)
+                    await reader.stream_string(decoder)
+                    decoder.finish()
+                else:
+                    fields[key] = await reader.value(max_field_chars)
+                separator = await reader.peek()
+                reader.pos += 1
+                if separator == '}':
+                    break
+                if separator != ',':
+                    raise ValueError("Invalid JSON body: expected ',' or '}'")
+        if await reader.peek() != '':
+            raise ValueError("Invalid JSON body: trailing data")
+    except Exception:
+        if audio is not None:
+            audio.close()
+        raise
+
+    peak = reader.peak + (audio.memory_bytes if audio is not None else 0)
+    stats['requests'] += 1
+    if audio is not None:
+        stats['spilled'] += int(audio.spilled)
+        stats['bytes_decoded'] += audio.size
+    stats['last_peak_buffer_bytes'] = peak
+    stats['peak_buffer_bytes'] = max(stats['peak_buffer_bytes'], peak)
+    return fields, audio
@@ -0,0 +1,169 @@
+"""
+Microbenchmarks for the CPU-side hot paths of the backend:
+
+- generate_levels: code-fence stripping + json.loads + unwrapping (parse),
+  per-item validation, level and repair prompt building
+- generate_svg_with_llm: SVG extraction from the LLM answer
+- transcribe: base64 (data URL) audio decoding at several payload sizes,
+  both in one go and streamed from the JSON body into a spooled file
+
+Reports ops/sec and peak allocated KiB per operation and compares them
+with a baseline (--save-baseline writes one; data/ is not versioned, so
+each machine or CI cache keeps its own). Exits with status 1 when any
+case is slower than the baseline by more than --threshold, and 2 when
+there is no baseline to compare against.
+
+    python benchmarks/bench_hot_paths.py --save-baseline
+    python benchmarks/bench_hot_paths.py --threshold 0.25
+"""
+import os
+import sys
+import json
+import timeit
+import base64
+import random
+import asyncio
+import argparse
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from level_validation import (
+    parse_level_items, validate_phoneme_level, validate_math_level,
+    phoneme_level_prompt, math_level_prompt, phoneme_repair_prompt
+)
+from generate_assets import extract_svg
+from audio_payload import decode_audio, read_json_audio
+
+FIXTURES = os.path.join(HERE, 'fixtures', 'llm_outputs.json')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(HERE), 'data', 'bench_baseline.json')
+AUDIO_SIZES_KIB = (16, 256, 2048)
+
+
+def _audio_payload(size_kib):
+    # Bytes pseudoaleatorios (incompresibles, como audio real) en forma de data URL
+    rng = random.Random(size_kib)
+    raw = bytes(rng.getrandbits(8) for _ in range(size_kib * 1024))
+    return 'data:audio/wav;base64,' + base64.b64encode(raw).decode('ascii')
+
+
+def _stream_decode(body, chunk_size=64 * 1024):
+    # Como uvicorn: el cuerpo llega en trozos de ~64 KiB
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+
+    async def decode():
+        _, audio = await read_json_audio(chunks())
+        audio.close()
+    asyncio.run(decode())
+
+
+def build_cases():
+    """[(stage, name, fn)] with all inputs prepared up front."""
+    with open(FIXTURES, 'r', encoding='utf-8') as f:
+        outputs = json.load(f)
+
+    phoneme_items = parse_level_items(outputs['phoneme_wrapped'])
+    math_items = parse_level_items(outputs['math_wrapped'])
+    valid, _ = validate_phoneme_level(phoneme_items, 'M', 5)
+
+    cases = [
+        ('parse', 'phoneme_fenced', lambda: parse_level_items(outputs['phoneme_fenced'])),
+        ('parse', 'phoneme_wrapped', lambda: parse_level_items(outputs['phoneme_wrapped'])),
+        ('parse', 'math_wrapped', lambda: parse_level_items(outputs['math_wrapped'])),
+        ('validation', 'phoneme', lambda: validate_phoneme_level(phoneme_items, 'M', 5)),
+        ('validation', 'math', lambda: validate_math_level(math_items, 5)),
+        ('prompt', 'phoneme_level', lambda: phoneme_level_prompt('M', 5)),
+        ('prompt', 'math_level', lambda: math_level_prompt('easy', 5)),
+        ('prompt', 'phoneme_repair', lambda: phoneme_repair_prompt(valid, 'M', 5)),
+        ('svg', 'extract', lambda: extract_svg(outputs['svg_response'])),
+    ]
+    for size in AUDIO_SIZES_KIB:
+        payload = _audio_payload(size)
+        body = json.dumps({'audio': payload, 'format': 'wav', 'language': 'es'}).encode('ascii')
+        cases.append(('decode', f'audio_{size}k', lambda payload=payload: decode_audio(payload)))
+        cases.append(('decode', f'stream_{size}k', lambda body=body: _stream_decode(body)))
+    return cases
+
+
+def measure(fn, repeat=5, quick=False):
+    timer = timeit.Timer(fn)
+    # autorange: tantas vueltas como quepan en ~0.2 s; se queda la mejor repetición
+    loops = 10 if quick else timer.autorange()[0]
+    best = min(timer.repeat(repeat=repeat, number=loops)) / loops
+
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return {'ops_per_sec': round(1 / best, 1), 'alloc_peak_kib': round(peak / 1024, 2)}
+
+
+def run(repeat=5, quick=False):
+    return {f"{stage}.{name}": measure(fn, repeat, quick) for stage, name, fn in build_cases()}
+
+
+def regressions(results, baseline, threshold):
+    """Cases whose ops/sec fell more than `threshold` (fraction) below the baseline."""
+    slower = {}
+    for case, result in results.items():
+        reference = baseline.get(case)
+        if reference and result['ops_per_sec'] < reference['ops_per_sec'] * (1 - threshold):
+            slower[case] = round(1 - result['ops_per_sec'] / reference['ops_per_sec'], 3)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hot-path microbenchmarks")
+    parser.add_argument('--baseline', default=os.getenv('BENCH_BASELINE') or DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=float(os.getenv('BENCH_THRESHOLD') or 0.25),
+                        help="Allowed throughput drop vs baseline (0.25 = 25%%)")
+    parser.add_argument('--quick', action='store_true', help="Fewer/shorter repeats (smoke run)")
+    parser.add_argument('--json', action='store_true', help="Print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run(repeat=2, quick=True) if args.quick else run()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'case':<28}{'ops/sec':>14}{'alloc KiB/op':>14}{'vs baseline':>14}")
+        for case, result in results.items():
+            reference = baseline.get(case)
+            delta = f"{result['ops_per_sec'] / reference['ops_per_sec'] - 1:+.1%}" if reference else '-'
+            print(f"{case:<28}{result['ops_per_sec']:>14,.1f}{result['alloc_peak_kib']:>14}{delta:>14}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Baseline saved to {args.baseline}")
+        return 0
+
+    if not baseline:
+        # Sin referencia no hay comparación posible: no se da por bueno en silencio
+        print(f"❌ No baseline at {args.baseline}: run with --save-baseline on a reference machine first")
+        return 2
+
+    slower = regressions(results, baseline, args.threshold)
+    if slower:
+        for case, drop in slower.items():
+            print(f"❌ {case} is {drop:.0%} slower than baseline (threshold {args.threshold:.0%})")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
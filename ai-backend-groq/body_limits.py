@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import logging
+
+from starlette.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Tamaño máximo del cuerpo por ruta: con Content-Length se rechaza con 413 antes de
+# leer nada; sin él (chunked) se corta en cuanto lo recibido pasa del límite.
+
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_ROUTE_LIMITS = {
+    '/transcribe': 16 * 1024 * 1024,
+    '/chat': 4 * 1024 * 1024
+}
+
+_SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*(b|kb|k|mb|m|gb|g)?\s*$', re.IGNORECASE)
+_UNITS = {'b': 1, 'k': 1024, 'kb': 1024, 'm': 1024 ** 2, 'mb': 1024 ** 2, 'g': 1024 ** 3, 'gb': 1024 ** 3}
+
+stats = {'rejected_content_length': 0, 'rejected_streaming': 0, 'per_route': {}}
+
+
+def parse_size(value):
+    """'16MB', '512kb', '1048576' -> bytes (binary units), None if unparseable."""
+    match = _SIZE.match(str(value or ''))
+    if not match:
+        return None
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[(unit or 'b').lower()])
+
+
+def route_limits():
+    """
+    Per-path limits: DEFAULT_ROUTE_LIMITS overridden by BODY_LIMITS
+    ('/transcribe=16MB,/chat=4MB'); other paths use BODY_MAX_BYTES.
+    """
+    limits = dict(DEFAULT_ROUTE_LIMITS)
+    for item in os.getenv('BODY_LIMITS', '').split(','):
+        path, _, size = item.partition('=')
+        parsed = parse_size(size)
+        if path.strip() and parsed is not None:
+            limits[path.strip().rstrip('/') or '/'] = parsed
+        elif item.strip():
+            logger.warning(f"⚠️ Ignoring invalid BODY_LIMITS entry: {item!r}")
+    default = parse_size(os.getenv('BODY_MAX_BYTES')) or DEFAULT_MAX_BYTES
+    return limits, default
+
+
+class BodyTooLarge(HTTPException):
+    # HTTPException: si salta mientras FastAPI lee el cuerpo, su propio handler responde 413 (con CORS)
+    def __init__(self, limit):
+        super().__init__(status_code=413, detail=f"Request body too large (max {limit} bytes)")
+        self.limit = limit
+
+
+class BodyLimitMiddleware:
+    """
+    ASGI middleware enforcing a maximum request body size per route with a
+    413: immediately from Content-Length, or as soon as a streamed body
+    crosses the limit (the rest is never read).
+    """
+
+    def __init__(self, app, limits=None, default_max_bytes=None):
+        self.app = app
+        env_limits, env_default = route_limits()
+        self.limits = limits if limits is not None else env_limits
+        self.default_max_bytes = default_max_bytes or env_default
+
+    def limit_for(self, path):
+        return self.limits.get(path.rstrip('/') or '/', self.default_max_bytes)
+
+    def _route_stats(self, path):
+        # Solo rutas configuradas (las demás juntas): paths arbitrarios no hacen crecer las stats
+        key = path.rstrip('/') or '/'
+        key = key if key in self.limits else '*'
+        return stats['per_route'].setdefault(key, {'requests': 0, 'rejected': 0, 'max_body_bytes': 0})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] in ('GET', 'HEAD', 'OPTIONS'):
+            return await self.app(scope, receive, send)
+
+        path = scope['path']
+        limit = self.limit_for(path)
+        route = self._route_stats(path)
+        route['requests'] += 1
+
+        content_length = None
+        for name, value in scope.get('headers', []):
+            if name == b'content-length':
+                try:
+                    content_length = int(value)
+                except ValueError:
+                    pass
+                break
+        if content_length is not None and content_length > limit:
+            stats['rejected_content_length'] += 1
+            route['rejected'] += 1
+            return await self._send_too_large(send, limit)
+
+        received = 0
+        started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                route['max_body_bytes'] = max(route['max_body_bytes'], received)
+                if received > limit:
+                    stats['rejected_streaming'] += 1
+                    route['rejected'] += 1
+                    raise BodyTooLarge(limit)
+            return message
+
+        async def tracking_send(message):
+            nonlocal started
+            if message['type'] == 'http.response.start':
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except BodyTooLarge:
+            # Cuerpo leído fuera de FastAPI (p.ej. el buffer de Idempotency-Key)
+            if started:
+                raise
+            await self._send_too_large(send, limit)
+
+    async def _send_too_large(self, send, limit):
+        body = json.dumps({'detail': BodyTooLarge(limit).detail}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                        (b'connection', b'close')]
+        })
+        await send({'type': 'http.response.body', 'body': body})
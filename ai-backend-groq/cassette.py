@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+
+from startup import lazy_import
+from ttl_cache import fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Grabación / reproducción del tráfico a Groq y gTTS (CASSETTE_MODE=off | record | replay).
+# Cada interacción se guarda como CASSETTE_DIR/<kind>-<fingerprint>.json; la clave depende
+# solo de la petición (URL + cuerpo), nunca de las cabeceras (la API key no se graba).
+
+stats = {'recorded': 0, 'replayed': 0, 'misses': 0}
+_write_lock = threading.Lock()
+
+
+class CassetteMiss(Exception):
+    """Replay mode found no recording for a request (and CASSETTE_ON_MISS=error)."""
+
+
+class CassetteResponse:
+    """Just the part of requests.Response the backend uses."""
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def mode():
+    # Se lee en cada uso: los módulos se importan antes de load_dotenv()
+    return os.getenv('CASSETTE_MODE', 'off').lower()
+
+
+def _dir():
+    return os.getenv('CASSETTE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'cassettes')
+
+
+def _path(kind, key):
+    return os.path.join(_dir(), f"{kind}-{key}.json")
+
+
+def _load(kind, key):
+    try:
+        with open(_path(kind, key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _save(kind, key, record):
+    directory = _dir()
+    os.makedirs(directory, exist_ok=True)
+    path = _path(kind, key)
+    with _write_lock:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, path)
+    stats['recorded'] += 1
+
+
+def _replay(kind, key):
+    """Recorded interaction or None (passthrough) on a miss; sleeps the recorded latency if asked."""
+    record = _load(kind, key)
+    if record is None:
+        stats['misses'] += 1
+        if os.getenv('CASSETTE_ON_MISS', 'error').lower() == 'live':
+            logger.warning(f"📼 Cassette miss ({kind}), calling upstream live")
+            return None
+        raise CassetteMiss(f"No recording for {kind} request {key}")
+    stats['replayed'] += 1
+    if os.getenv('CASSETTE_REPLAY_LATENCY', '0') == '1':
+        time.sleep(record.get('latency_ms', 0) / 1000)
+    return record
+
+
+def _request_key(url, json_body=None, data=None, files=None):
+    parts = [url]
+    if json_body is not None:
+        parts.append(json.dumps(json_body, sort_keys=True, ensure_ascii=False))
+    if data is not None:
+        parts.append(json.dumps(data, sort_keys=True, ensure_ascii=False))
+    for field, spec in sorted((files or {}).items()):
+        filename, fileobj = spec[0], spec[1]
+        if hasattr(fileobj, 'getvalue'):
+            content = fileobj.getvalue()
+        elif hasattr(fileobj, 'read'):
+            # Fichero (audio en spool): se lee y se deja donde estaba para el envío real
+            position = fileobj.tell()
+            content = fileobj.read()
+            fileobj.seek(position)
+        else:
+            content = fileobj
+        parts += [field, filename, content]
+    return fingerprint(*parts)
+
+
+def post(kind, url, timeout=None, **kwargs):
+    """
+    requests.post through the cassette. Only completed responses are
+    recorded; connection errors and timeouts are raised as usual.
+    """
+    current = mode()
+    if current not in ('record', 'replay'):
+        return lazy_import('requests').post(url, timeout=timeout, **kwargs)
+
+    key = _request_key(url, kwargs.get('json'), kwargs.get('data'), kwargs.get('files'))
+    if current == 'replay':
+        record = _replay(kind, key)
+        if record is not None:
+            return CassetteResponse(record['status'], record['body'])
+
+    started = time.perf_counter()
+    response = lazy_import('requests').post(url, timeout=timeout, **kwargs)
+    if current == 'record':
+        _save(kind, key, {
+            'kind': kind,
+            'url': url,
+            'request': kwargs.get('json') or kwargs.get('data'),
+            'status': response.status_code,
+            'body': response.text,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'recorded_at': time.time()
+        })
+    return response
+
+
+def call_bytes(kind, key_parts, live):
+    """Same as post() for upstream calls that return raw bytes (gTTS)."""
+    current = mode()
+    if current not in ('record', 'replay'):
+        return live()
+
+    key = fingerprint(*[str(part) for part in key_parts])
+    if current == 'replay':
+        record = _replay(kind, key)
+        if record is not None:
+            return base64.b64decode(record['body_b64'])
+
+    started = time.perf_counter()
+    content = live()
+    if current == 'record':
+        _save(kind, key, {
+            'kind': kind,
+            'request': [str(part) for part in key_parts],
+            'body_b64': base64.b64encode(content).decode('ascii'),
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'recorded_at': time.time()
+        })
+    return content
@@ -0,0 +1,108 @@
+import os
+import math
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+# Mensajes de chat tipados + presupuesto de contexto estimado en local, para no
+# mandar a Groq historiales que crecen sin límite (más tokens y más latencia por turno).
+
+MAX_MESSAGE_CHARS = 16000
+MAX_MESSAGES = 200
+
+# Estimación barata: ~3.5 caracteres por token en español/inglés + coste fijo por mensaje
+CHARS_PER_TOKEN = 3.5
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+class ChatMessage(BaseModel):
+    role: Literal['system', 'user', 'assistant']
+    content: str = Field(..., max_length=MAX_MESSAGE_CHARS)
+    name: Optional[str] = Field(default=None, max_length=64)
+
+
+class ContextBudgetExceeded(ValueError):
+    """The messages that must be kept (system + last turn) alone exceed the budget."""
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(message):
+    return estimate_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Keeps the start of `text` within roughly `max_tokens`."""
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    if max_chars <= 0:
+        return ''
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + '…'
+
+
+def context_budget():
+    # Se lee en cada uso (load_dotenv va después de los imports)
+    return int(os.getenv('CHAT_CONTEXT_TOKENS', 3000)), int(os.getenv('CHAT_SUMMARY_TOKENS', 200))
+
+
+def _summary(dropped, max_tokens):
+    # Resumen extractivo local (sin otra llamada al LLM): inicio de los turnos descartados más recientes
+    recent = dropped[-max(1, max_tokens // 12):]
+    per_turn = max(8, max_tokens // len(recent))
+    lines = [f"{m['role']}: {truncate_to_tokens(' '.join(m['content'].split()), per_turn)}" for m in recent]
+    text = "Earlier conversation (summarized):\n" + '\n'.join(lines)
+    return {'role': 'system', 'content': truncate_to_tokens(text, max_tokens)}
+
+
+def fit_to_budget(messages, max_tokens=None, summary_tokens=None):
+    """
+    Drops the oldest non-system turns until the estimated prompt fits in
+    `max_tokens`, replacing them with a short summary note when it fits.
+    System messages and the last message are always kept.
+
+    Returns (messages, info) where info has estimated tokens before/after and
+    how many turns were dropped; raises ContextBudgetExceeded when even the
+    kept messages do not fit.
+    """
+    default_max, default_summary = context_budget()
+    max_tokens = max_tokens or default_max
+    summary_tokens = default_summary if summary_tokens is None else summary_tokens
+
+    before = sum(message_tokens(m) for m in messages)
+    info = {'estimated_tokens': before, 'trimmed_turns': 0, 'summarized': False}
+    if before <= max_tokens:
+        return messages, info
+
+    last = messages[-1]
+    system = [m for m in messages[:-1] if m['role'] == 'system']
+    history = [m for m in messages[:-1] if m['role'] != 'system']
+    fixed = sum(message_tokens(m) for m in system) + message_tokens(last)
+    if fixed > max_tokens:
+        raise ContextBudgetExceeded(
+            f"Messages need ~{fixed} tokens even without history (budget {max_tokens})")
+
+    # Turnos más recientes primero, mientras quepan con hueco para el resumen
+    kept = []
+    used = fixed
+    reserve = summary_tokens + MESSAGE_OVERHEAD_TOKENS if summary_tokens > 0 else 0
+    for message in reversed(history):
+        cost = message_tokens(message)
+        if used + cost + reserve > max_tokens:
+            break
+        kept.insert(0, message)
+        used += cost
+    dropped = history[:len(history) - len(kept)]
+
+    result = list(system)
+    if dropped and summary_tokens > 0 and used + reserve <= max_tokens:
+        result.append(_summary(dropped, summary_tokens))
+        info['summarized'] = True
+    result += kept + [last]
+
+    info.update({
+        'trimmed_turns': len(dropped),
+        'estimated_tokens': sum(message_tokens(m) for m in result),
+        'estimated_tokens_before': before
+    })
+    return result, info
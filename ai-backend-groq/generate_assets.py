@@ -3,14 +3,21 @@ import os
 import argparse
 import sys
 import time
-import requests
 import re
 import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from model_routing import chat_completion, UpstreamError
+from key_pool import default_pool
+from structured_logging import configure_logging
 
 # Load environment variables from .env file
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # --- CONFIGURATION ---
 # Points to your Unified Backend (ai-backend-groq)
 # Ensure this matches the port where your FastAPI backend is running (default usually 5001 or 8000)
@@ -18,21 +25,23 @@ GROQ_API_URL = os.getenv('GROQ_API_URL', 'https://api.groq.com/openai/v1')
 
 # Directory to save assets
 ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'assets', 'generated')
+# Icons looked up by app.py check_icon() as <word>.svg (batch mode default)
+ICONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'frontend', 'assets', 'icons')
 
-DEFAULT_SVG_MODEL = "openai/gpt-oss-120b"
-GROQ_API_KEY = os.getenv('GROQ_API_KEY', '')
+# First <svg>...</svg> block of the LLM answer (it may come wrapped in prose or code fences)
+SVG_BLOCK = re.compile(r'(<svg[\s\S]*?</svg>)')
 
-# --- OPTIONAL IMPORTS FOR PIXEL GENERATION ---
-# This allows the script to work even if you don't have the heavy SDXL libraries installed
-try:
-    from huggingface_hub import hf_hub_download
-except ImportError:
-    hf_hub_download = None
+def extract_svg(content):
+    """LLM content -> standalone SVG markup, or None if there is no <svg> block."""
+    svg_match = SVG_BLOCK.search(content)
+    if not svg_match:
+        return None
+    clean_svg = svg_match.group(1)
 
-try:
-    from stable_diffusion_cpp import StableDiffusion
-except ImportError:
-    StableDiffusion = None
+    # PARCHE DE SEGURIDAD
+    if "xmlns=" not in clean_svg:
+        clean_svg = clean_svg.replace('<svg', '<svg xmlns="http://www.w3.org/2000/svg"')
+    return clean_svg
 
 def ensure_dir(path):
     if not os.path.exists(path):
@@ -40,7 +49,7 @@ def ensure_dir(path):
 
 # --- SVG GENERATION LOGIC (NEW) ---
 def generate_svg_with_llm(prompt, output_path):
-    print(f"🎨 Generating Premium SVG for: '{prompt}'...")
+    logger.info(f"🎨 Generating Premium SVG for: '{prompt}'...", extra={'sample': True})
     
     # 1. EJEMPLO MAESTRO
     example_svg = """
@@ -67,84 +76,214 @@ def generate_svg_with_llm(prompt, output_path):
         f"EXAMPLE OF GOOD CODE:\n{example_svg}"
     )
     # Logic to toggle between Local and Direct Groq API
-    if GROQ_API_KEY and "api.groq.com" in GROQ_API_URL:
-        # Direct Call to Groq Cloud
-        url = f"{GROQ_API_URL}/chat/completions"
-        headers = {
-            'Authorization': f'Bearer {GROQ_API_KEY}',
-            'Content-Type': 'application/json'
-        }
+    if default_pool() and "api.groq.com" in GROQ_API_URL:
+        # Direct Call to Groq Cloud (pool de keys compartido con app.py)
+        api_key = default_pool()
     else:
         # Local Proxy (calls the currently running app.py if needed, BUT avoid if called from app.py)
         # Note: If called from app.py, this script should have GROQ_API_KEY set.
         # Fallback only
-        url = f"{GROQ_API_URL}/chat/completions"
-        headers = {'Content-Type': 'application/json'}
-
-    payload = {
-        "model": DEFAULT_SVG_MODEL,
-        "messages": [
-            {"role": "system", "content": system_instruction},
-            {"role": "user", "content": f"Generate a high-quality, cute SVG icon of: {prompt}. Make it fill the canvas properly."}
-        ],
-        "temperature": 0.2,
-        "max_tokens": 4096
-    }
+        api_key = None
+
+    messages = [
+        {"role": "system", "content": system_instruction},
+        {"role": "user", "content": f"Generate a high-quality, cute SVG icon of: {prompt}. Make it fill the canvas properly."}
+    ]
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if 'choices' in data:
-                content = data['choices'][0]['message']['content']
-            elif 'content' in data:
-                content = data['content']
-            else:
-                content = str(data)
-
-            svg_match = re.search(r'(<svg[\s\S]*?</svg>)', content)
-            
-            if svg_match:
-                clean_svg = svg_match.group(1)
-                
-                # PARCHE DE SEGURIDAD
-                if "xmlns=" not in clean_svg:
-                    clean_svg = clean_svg.replace('<svg', '<svg xmlns="http://www.w3.org/2000/svg"')
-
-                # CORRECCIÓN AQUÍ: Usamos output_path en lugar de output_file
-                with open(output_path, 'w') as f:
-                    f.write(clean_svg)
-                print(f"✅ Premium SVG Saved to: {output_path}")
-            else:
-                print("⚠️ Error: LLM did not return valid SVG code.")
-                print(f"Raw Output: {content[:200]}...") 
+        # Model, max_tokens, temperature and timeout come from the 'svg-icon' route (model_routing.py)
+        data, model = chat_completion('svg-icon', messages, GROQ_API_URL, api_key)
+
+        if 'choices' in data:
+            content = data['choices'][0]['message']['content']
+        elif 'content' in data:
+            content = data['content']
         else:
-            print(f"❌ API Error {response.status_code}: {response.text}")
+            content = str(data)
+
+        clean_svg = extract_svg(content)
 
+        if clean_svg:
+            # CORRECCIÓN AQUÍ: Usamos output_path en lugar de output_file
+            # Escritura atómica: un corte a mitad no deja un icono truncado que parezca válido
+            tmp_path = f"{output_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(clean_svg)
+            os.replace(tmp_path, output_path)
+            logger.info(f"✅ Premium SVG Saved to: {output_path} ({model})", extra={'sample': True})
+            return True
+        else:
+            logger.warning("⚠️ Error: LLM did not return valid SVG code.")
+            logger.warning("Raw Output", extra={"content": content[:200]})
+
+    except UpstreamError as e:
+        logger.error(f"❌ API Error {e.status_code}: {e.detail}")
     except Exception as e:
-        print(f"❌ Connection Failed: {e}")
+        logger.error(f"❌ Connection Failed: {e}")
+    return False
 
 # --- PIXEL IMAGE LOGIC (OLD/OPTIONAL) ---
 def generate_image_sdxl(prompt, output_path, steps=20, style='cinematic'):
+    # --- OPTIONAL IMPORTS FOR PIXEL GENERATION ---
+    # Probed here instead of at import time: app.py imports this module and
+    # should not pay for the heavy SDXL libraries on a cold start
+    try:
+        from stable_diffusion_cpp import StableDiffusion
+    except ImportError:
+        StableDiffusion = None
+
     if not StableDiffusion:
-        print("❌ Error: 'stable-diffusion-cpp-python' not installed.")
-        print("   Use --type svg to generate assets using the LLM instead.")
+        logger.error("❌ Error: 'stable-diffusion-cpp-python' not installed.")
+        logger.error("   Use --type svg to generate assets using the LLM instead.")
         return
 
-    print(f"📷 Generating Pixel Image for: '{prompt}'...")
+    logger.info(f"📷 Generating Pixel Image for: '{prompt}'...")
     # ... (Keep your original SDXL logic here if you want, or leave empty)
     # For brevity, I am pointing to the new SVG logic mostly.
-    print("   (SDXL generation skipped in this snippet. Install dependencies to enable.)")
+    logger.info("   (SDXL generation skipped in this snippet. Install dependencies to enable.)")
+
+# --- BATCH MODE ---
+class RateLimiter:
+    """Spaces calls so that at most `rate` start per second across all workers."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class BatchManifest:
+    """
+    Per-word status (pending/done/failed/skipped), bytes, latency and retries,
+    rewritten atomically after every word so an interrupted run can resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('words', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Manifest ilegible ({path}), se empieza de cero: {e}")
+
+    def get(self, word):
+        return self.entries.get(word, {})
+
+    def update(self, word, **fields):
+        with self.lock:
+            self.entries.setdefault(word, {}).update(fields, updated_at=int(time.time()))
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': 1, 'words': self.entries}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+
+    def summary(self):
+        counts = {}
+        for entry in self.entries.values():
+            counts[entry.get('status')] = counts.get(entry.get('status'), 0) + 1
+        return counts
+
+
+def read_word_list(path):
+    """One word per line; blank lines and '#' comments are ignored, duplicates dropped."""
+    words = []
+    seen = set()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            word = line.split('#', 1)[0].strip().lower()
+            if word and word not in seen:
+                seen.add(word)
+                words.append(word)
+    return words
+
+
+def _generate_one(word, out_dir, manifest, limiter, max_retries):
+    output_path = os.path.join(out_dir, f"{word}.svg")
+    retries = manifest.get(word).get('retries', 0)
+    for attempt in range(max_retries + 1):
+        limiter.wait()
+        started = time.perf_counter()
+        ok = generate_svg_with_llm(word, output_path)
+        latency_ms = round((time.perf_counter() - started) * 1000)
+        if ok:
+            manifest.update(word, status='done', bytes=os.path.getsize(output_path),
+                            latency_ms=latency_ms, retries=retries)
+            return
+        retries += 1
+        manifest.update(word, status='failed', latency_ms=latency_ms, retries=retries)
+        if attempt < max_retries:
+            time.sleep(min(2 ** attempt, 30))
+
+
+def run_batch(words, out_dir, manifest_path=None, workers=4, rate=1.0, max_retries=2):
+    """
+    Generates one SVG per word with a thread pool under a global rate limit.
+    Words whose icon already exists are skipped; the manifest records progress.
+    """
+    ensure_dir(out_dir)
+    manifest = BatchManifest(manifest_path or os.path.join(out_dir, '.batch_manifest.json'))
+    limiter = RateLimiter(rate)
+
+    pending = []
+    for word in words:
+        existing = os.path.join(out_dir, f"{word}.svg")
+        if os.path.exists(existing):
+            if manifest.get(word).get('status') not in ('done', 'skipped'):
+                manifest.update(word, status='skipped', bytes=os.path.getsize(existing))
+            continue
+        manifest.update(word, status='pending')
+        pending.append(word)
+
+    logger.info(f"📦 Batch: {len(pending)} to generate, {len(words) - len(pending)} already present")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(lambda w: _generate_one(w, out_dir, manifest, limiter, max_retries), pending))
+
+    summary = manifest.summary()
+    logger.info(f"📊 Batch finished: {summary}")
+    return summary
+
 
 # --- MAIN EXECUTION ---
 def main():
     parser = argparse.ArgumentParser(description="Generate assets using Groq/LLM (SVG) or Local SDXL (Images).")
-    parser.add_argument('prompt', type=str, help="Text description of the asset.")
+    parser.add_argument('prompt', type=str, nargs='?', help="Text description of the asset.")
     parser.add_argument('--type', choices=['image', 'svg'], default='svg', help="Type of asset to generate (default: svg).")
     parser.add_argument('--output', type=str, help="Custom output filename.")
+    parser.add_argument('--batch', type=str, help="Word list file (one per line): generate <word>.svg for each.")
+    parser.add_argument('--out-dir', type=str, default=ICONS_DIR, help="Batch output directory (default: frontend/assets/icons).")
+    parser.add_argument('--manifest', type=str, help="Batch manifest path (default: <out-dir>/.batch_manifest.json).")
+    parser.add_argument('--workers', type=int, default=4, help="Concurrent batch workers (default: 4).")
+    parser.add_argument('--rate', type=float, default=1.0, help="Max LLM calls started per second (default: 1.0).")
+    parser.add_argument('--retries', type=int, default=2, help="Retries per word on failure (default: 2).")
     
     args = parser.parse_args()
+
+    configure_logging(default_format='text')
+
+    if args.batch:
+        if args.type != 'svg':
+            parser.error("--batch only supports --type svg")
+        summary = run_batch(read_word_list(args.batch), args.out_dir, args.manifest,
+                            workers=args.workers, rate=args.rate, max_retries=args.retries)
+        sys.exit(1 if summary.get('failed') else 0)
+
+    if not args.prompt:
+        parser.error("prompt is required unless --batch is given")
     
     ensure_dir(ASSETS_DIR)
     
@@ -0,0 +1,199 @@
+import os
+import gzip
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Compresión (br/gzip según Accept-Encoding) y ETag / If-None-Match -> 304 para las respuestas HTTP.
+# El MP3 y las imágenes rasterizadas ya van comprimidos y no se tocan.
+
+COMPRESSIBLE_TYPES = ('application/json', 'image/svg+xml', 'text/', 'application/javascript')
+
+stats = {'compressed': 0, 'bytes_in': 0, 'bytes_out': 0, 'not_modified': 0, 'precompressed': 0}
+
+_brotli = None
+_brotli_probed = False
+
+
+def _brotli_module():
+    # Import diferido y opcional (pip install brotli); sin él solo gzip
+    global _brotli, _brotli_probed
+    if not _brotli_probed:
+        try:
+            import brotli
+        except ImportError:
+            brotli = None
+        _brotli, _brotli_probed = brotli, True
+    return _brotli
+
+
+def accepted_encodings(accept_encoding):
+    """'gzip, br;q=0.8, deflate;q=0' -> {'gzip', 'br', 'deflate'} minus q=0 entries."""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(name)
+    return accepted
+
+
+def choose_encoding(accept_encoding):
+    accepted = accepted_encodings(accept_encoding)
+    if 'br' in accepted and _brotli_module() is not None:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return _brotli_module().compress(body, quality=int(os.getenv('COMPRESS_BROTLI_QUALITY', 5)))
+    return gzip.compress(body, compresslevel=int(os.getenv('COMPRESS_GZIP_LEVEL', 6)), mtime=0)
+
+
+def precompressed(path, accept_encoding):
+    """(path, encoding) of a .br/.gz sibling the client accepts that is not older than `path`."""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        candidate = path + suffix
+        if encoding in accepted and os.path.exists(candidate) \
+                and os.path.getmtime(candidate) >= os.path.getmtime(path):
+            stats['precompressed'] += 1
+            return candidate, encoding
+    return path, None
+
+
+def _bare_etag(tag):
+    # Comparación débil (RFC 9110): W/"x" equivale a "x"; "x-gzip" / "x-br" son el mismo contenido
+    tag = tag.strip().removeprefix('W/')
+    for suffix in ('-gzip"', '-br"'):
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)] + '"'
+    return tag
+
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == '*':
+        return True
+    return any(_bare_etag(tag) == _bare_etag(etag) for tag in if_none_match.split(','))
+
+
+def _tag_encoding(headers, encoding):
+    # El ETag identifica la representación: distinto por codificación
+    return [(k, v[:-1] + f'-{encoding}"'.encode('latin-1'))
+            if k.lower() == b'etag' and v.endswith(b'"') else (k, v) for k, v in headers]
+
+
+class HTTPCachingMiddleware:
+    """
+    ASGI middleware for complete (buffered) HTTP responses:
+
+    - GET/HEAD 200 responses get an ETag (the app's own, or a hash of the
+      body) and a matching If-None-Match is answered with 304.
+    - Compressible bodies above COMPRESS_MIN_BYTES are sent as br or gzip
+      depending on Accept-Encoding. Responses that already carry a
+      Content-Encoding (precompressed files) are left alone.
+
+    Bodies larger than COMPRESS_MAX_BUFFER_BYTES are streamed untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.min_bytes = int(os.getenv('COMPRESS_MIN_BYTES', 512))
+        self.max_buffer = int(os.getenv('COMPRESS_MAX_BUFFER_BYTES', 4 * 1024 * 1024))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        request_headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        conditional = scope['method'] in ('GET', 'HEAD')
+        encoding = choose_encoding(request_headers.get('accept-encoding'))
+        if_none_match = request_headers.get('if-none-match')
+
+        start = None
+        chunks = []
+        buffered = 0
+        passthrough = False
+
+        async def buffering_send(message):
+            nonlocal start, buffered, passthrough
+            if passthrough:
+                return await send(message)
+            if message['type'] == 'http.response.start':
+                start = message
+                return
+            if message['type'] != 'http.response.body':
+                # Extensiones (p.ej. pathsend): sin buffer
+                passthrough = True
+                if start is not None:
+                    await send(start)
+                return await send(message)
+
+            chunks.append(message.get('body', b''))
+            buffered += len(chunks[-1])
+            if message.get('more_body'):
+                if buffered > self.max_buffer:
+                    # Demasiado grande para bufferizar: se envía tal cual
+                    passthrough = True
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': True})
+                    chunks.clear()
+                return
+            await self._finish(start, b''.join(chunks), send, conditional, encoding, if_none_match)
+
+        await self.app(scope, receive, buffering_send)
+
+    async def _finish(self, start, body, send, conditional, encoding, if_none_match):
+        headers = [(k, v) for k, v in start.get('headers', [])]
+        lookup = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in headers}
+        status = start['status']
+        content_type = lookup.get('content-type', '')
+        compressible = content_type.startswith(COMPRESSIBLE_TYPES) and 'content-encoding' not in lookup
+        if compressible and 'accept-encoding' not in lookup.get('vary', '').lower():
+            headers.append((b'vary', b'Accept-Encoding'))
+        will_compress = compressible and encoding and len(body) >= self.min_bytes
+
+        if conditional and status == 200:
+            etag = lookup.get('etag')
+            if etag is None and body:
+                etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+                headers.append((b'etag', etag.encode('latin-1')))
+            if etag and if_none_match and _etag_matches(if_none_match, etag):
+                stats['not_modified'] += 1
+                if will_compress:
+                    headers = _tag_encoding(headers, encoding)
+                keep = {b'etag', b'cache-control', b'vary', b'x-request-id', b'server-timing',
+                        b'access-control-allow-origin', b'expires', b'last-modified'}
+                await send({'type': 'http.response.start', 'status': 304,
+                            'headers': [(k, v) for k, v in headers if k.lower() in keep]})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+
+        if will_compress:
+            compressed = compress(body, encoding)
+            if len(compressed) < len(body):
+                stats['compressed'] += 1
+                stats['bytes_in'] += len(body)
+                stats['bytes_out'] += len(compressed)
+                body = compressed
+                headers = [(k, v) for k, v in headers if k.lower() != b'content-length']
+                headers += [(b'content-encoding', encoding.encode('latin-1')),
+                            (b'content-length', str(len(body)).encode('latin-1'))]
+                headers = _tag_encoding(headers, encoding)
+
+        await send({**start, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,173 @@
+import io
+import os
+import re
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Variantes rasterizadas de los iconos SVG para tablets lentas: PNG/WebP a tamaños fijos,
+# generadas en segundo plano (nunca en la petición) y cacheadas en disco.
+# Requiere cairosvg (PNG, necesita libcairo del sistema) y Pillow (WebP), ambas en
+# requirements.txt; si faltan se sigue sirviendo el SVG.
+
+FORMATS = ('png', 'webp')
+MEDIA_TYPES = {'png': 'image/png', 'webp': 'image/webp', 'svg': 'image/svg+xml'}
+_ICON_NAME = re.compile(r'^[\w-]+$')
+
+stats = {'rendered': 0, 'failed': 0, 'served': 0, 'svg_fallback': 0}
+
+
+DEFAULT_SIZES = (64, 128, 256)
+
+
+def sizes():
+    """ICON_SIZES as sorted ints; invalid entries are ignored and an empty list means the defaults."""
+    parsed = set()
+    for part in os.getenv('ICON_SIZES', '').split(','):
+        try:
+            size = int(part)
+        except ValueError:
+            continue
+        if 0 < size <= 2048:
+            parsed.add(size)
+    return sorted(parsed) or list(DEFAULT_SIZES)
+
+
+def pick_size(requested):
+    """Smallest pre-rendered size that covers `requested` (largest one if none does)."""
+    available = sizes()
+    for size in available:
+        if size >= requested:
+            return size
+    return available[-1]
+
+
+def valid_name(name):
+    return bool(_ICON_NAME.match(name or ''))
+
+
+class IconVariants:
+    """Renders and locates PNG/WebP variants of the SVGs in `icons_dir` under `out_dir`."""
+
+    def __init__(self, icons_dir, out_dir):
+        self.icons_dir = icons_dir
+        self.out_dir = out_dir
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='icon-raster')
+        self.lock = threading.Lock()
+        self.pending = set()
+        self._cairosvg = None
+        self._pil = None
+        self._probed = False
+
+    def _libraries(self):
+        # Import diferido: cairosvg/Pillow son opcionales y pesadas para el arranque
+        if not self._probed:
+            try:
+                import cairosvg
+            except (ImportError, OSError):
+                # OSError: cairosvg instalado pero sin libcairo en el sistema
+                cairosvg = None
+            try:
+                from PIL import Image
+            except ImportError:
+                Image = None
+            self._cairosvg, self._pil = cairosvg, Image
+            self._probed = True
+            if self._cairosvg is None:
+                logger.warning("⚠️ cairosvg/libcairo not available: icons are served as SVG only")
+        return self._cairosvg, self._pil
+
+    def svg_path(self, name):
+        return os.path.join(self.icons_dir, f"{name}.svg")
+
+    def variant_path(self, name, size, fmt):
+        return os.path.join(self.out_dir, str(size), f"{name}.{fmt}")
+
+    def _is_fresh(self, name, size, fmt):
+        try:
+            return os.path.getmtime(self.variant_path(name, size, fmt)) >= os.path.getmtime(self.svg_path(name))
+        except OSError:
+            return False
+
+    def lookup(self, name, size, fmt):
+        """Path of an up-to-date variant, or None (schedule() it and serve the SVG meanwhile)."""
+        if fmt in FORMATS and self._is_fresh(name, size, fmt):
+            return self.variant_path(name, size, fmt)
+        return None
+
+    def render(self, name):
+        """Blocking: writes every missing size/format of icon `name`. Returns files written."""
+        cairosvg, image = self._libraries()
+        svg_path = self.svg_path(name)
+        if cairosvg is None or not os.path.exists(svg_path):
+            return 0
+
+        written = 0
+        for size in sizes():
+            missing = [fmt for fmt in FORMATS
+                       if (fmt == 'png' or image is not None) and not self._is_fresh(name, size, fmt)]
+            if not missing:
+                continue
+            try:
+                # Se rasteriza una vez por tamaño; el WebP sale del PNG
+                png = cairosvg.svg2png(url=svg_path, output_width=size, output_height=size)
+                for fmt in missing:
+                    path = self.variant_path(name, size, fmt)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.tmp"
+                    if fmt == 'png':
+                        with open(tmp_path, 'wb') as f:
+                            f.write(png)
+                    else:
+                        with image.open(io.BytesIO(png)) as img:
+                            img.save(tmp_path, format='WEBP', quality=85, method=4)
+                    os.replace(tmp_path, path)
+                    written += 1
+            except Exception as e:
+                stats['failed'] += 1
+                logger.warning(f"⚠️ Could not rasterize '{name}' at {size}px: {e}", extra={'sample': True})
+                break
+        stats['rendered'] += written
+        return written
+
+    def schedule(self, name):
+        """Queues `name` for background rendering (deduplicated)."""
+        if self._libraries()[0] is None:
+            return
+        with self.lock:
+            if name in self.pending:
+                return
+            self.pending.add(name)
+
+        def job():
+            try:
+                self.render(name)
+            finally:
+                with self.lock:
+                    self.pending.discard(name)
+
+        self.executor.submit(job)
+
+    def backfill(self):
+        """Queues every icon whose variants are missing or older than the SVG."""
+        if not os.path.isdir(self.icons_dir) or self._libraries()[0] is None:
+            return 0
+        queued = 0
+        for filename in os.listdir(self.icons_dir):
+            name, ext = os.path.splitext(filename)
+            if ext == '.svg' and valid_name(name) and not all(
+                    self._is_fresh(name, size, 'png') for size in sizes()):
+                self.schedule(name)
+                queued += 1
+        return queued
+
+    def snapshot_stats(self):
+        cairosvg, image = self._libraries()
+        return {
+            **stats,
+            'pending': len(self.pending),
+            'sizes': sizes(),
+            'formats': [fmt for fmt in FORMATS if cairosvg is not None and (fmt == 'png' or image is not None)]
+        }
@@ -0,0 +1,161 @@
+import os
+import base64
+import asyncio
+import hashlib
+import tempfile
+
+from ttl_cache import TTLCache, fingerprint
+
+IDEMPOTENCY_HEADER = b'idempotency-key'
+REPLAY_HEADER = b'idempotent-replayed'
+REPLAY_CHUNK_BYTES = 64 * 1024
+
+stats = {'stored': 0, 'replayed': 0, 'waited': 0, 'conflicts': 0}
+
+
+def build_store():
+    """
+    IDEMPOTENCY_STORE=memory (default) or disk (IDEMPOTENCY_DIR); both bounded
+    by IDEMPOTENCY_MAX_ENTRIES and expired after IDEMPOTENCY_TTL seconds.
+    """
+    kind = os.getenv('IDEMPOTENCY_STORE', 'memory').lower()
+    disk_dir = None
+    if kind == 'disk':
+        disk_dir = os.getenv('IDEMPOTENCY_DIR') or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), 'data', 'idempotency')
+    return TTLCache(
+        'idempotency',
+        max_entries=int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', 512)),
+        ttl_seconds=float(os.getenv('IDEMPOTENCY_TTL', 600)),
+        disk_dir=disk_dir,
+        max_disk_entries=int(os.getenv('IDEMPOTENCY_MAX_DISK_ENTRIES', 0)) or None
+    )
+
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware for POST requests carrying an Idempotency-Key header.
+
+    - While the first request with a key is running, duplicates wait for it.
+    - Completed non-5xx responses are stored and replayed to duplicates
+      within the TTL (with 'Idempotent-Replayed: true'); after a 5xx the
+      waiting duplicates run the request again.
+    - Reusing a key with a different body is rejected with 422.
+
+    The request body is hashed while it streams into a spooled temporary file
+    (RAM up to IDEMPOTENCY_SPOOL_BYTES, then disk) and handed on from there in
+    chunks, so large uploads (/transcribe) are never held whole in memory.
+    """
+
+    def __init__(self, app, store=None, max_body_bytes=None, spool_bytes=None):
+        self.app = app
+        self.store = store if store is not None else build_store()
+        self.max_body_bytes = max_body_bytes or int(os.getenv('IDEMPOTENCY_MAX_BODY_BYTES', 1024 * 1024))
+        self.spool_bytes = spool_bytes if spool_bytes is not None else int(os.getenv('IDEMPOTENCY_SPOOL_BYTES', 1024 * 1024))
+        self.inflight = {}  # key -> asyncio.Future resolved with the stored response
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] != 'POST':
+            return await self.app(scope, receive, send)
+
+        idempotency_key = None
+        for name, value in scope.get('headers', []):
+            if name == IDEMPOTENCY_HEADER:
+                idempotency_key = value.decode('latin-1').strip()
+                break
+        if not idempotency_key:
+            return await self.app(scope, receive, send)
+
+        body = tempfile.SpooledTemporaryFile(max_size=self.spool_bytes)
+        try:
+            await self._handle(scope, receive, send, idempotency_key, body)
+        finally:
+            body.close()
+
+    async def _handle(self, scope, receive, send, idempotency_key, body):
+        body_hash = await self._read_body(receive, body)
+        key = fingerprint(scope['path'], idempotency_key)
+
+        stored, _ = self.store.get(key)
+        while stored is None and key in self.inflight:
+            # None: la primera petición falló (excepción o 5xx); esta la vuelve a ejecutar
+            stats['waited'] += 1
+            stored = await asyncio.shield(self.inflight[key])
+
+        if stored is not None:
+            if stored['body_hash'] != body_hash:
+                stats['conflicts'] += 1
+                return await self._send_conflict(send)
+            stats['replayed'] += 1
+            return await self._replay(stored, send)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        captured = {'status': None, 'headers': [], 'body': []}
+        body.seek(0)
+        body_done = False
+
+        async def replay_receive():
+            nonlocal body_done
+            if not body_done:
+                chunk = body.read(REPLAY_CHUNK_BYTES)
+                body_done = len(chunk) < REPLAY_CHUNK_BYTES
+                return {'type': 'http.request', 'body': chunk, 'more_body': not body_done}
+            return await receive()
+
+        async def capture_send(message):
+            if message['type'] == 'http.response.start':
+                captured['status'] = message['status']
+                captured['headers'] = list(message.get('headers', []))
+            elif message['type'] == 'http.response.body':
+                captured['body'].append(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            record = None
+            # Excepción antes de empezar la respuesta o 5xx: no hay nada que reproducir (record None)
+            # y el cliente, o los duplicados en espera, pueden reintentar con la misma clave
+            if captured['status'] is not None and captured['status'] < 500:
+                payload = b''.join(captured['body'])
+                record = {
+                    'status': captured['status'],
+                    'headers': [[k.decode('latin-1'), v.decode('latin-1')] for k, v in captured['headers']],
+                    'body_b64': base64.b64encode(payload).decode('ascii'),
+                    'body_hash': body_hash
+                }
+                if len(payload) <= self.max_body_bytes:
+                    self.store.set(key, record)
+                    stats['stored'] += 1
+            future.set_result(record)
+            self.inflight.pop(key, None)
+
+    async def _read_body(self, receive, spool):
+        """Streams the request body into `spool`; returns its sha256 hex digest."""
+        sha = hashlib.sha256()
+        while True:
+            message = await receive()
+            if message['type'] != 'http.request':
+                break
+            chunk = message.get('body', b'')
+            spool.write(chunk)
+            sha.update(chunk)
+            if not message.get('more_body'):
+                break
+        return sha.hexdigest()
+
+    async def _replay(self, record, send):
+        headers = [(k.encode('latin-1'), v.encode('latin-1')) for k, v in record['headers']]
+        headers.append((REPLAY_HEADER, b'true'))
+        await send({'type': 'http.response.start', 'status': record['status'], 'headers': headers})
+        await send({'type': 'http.response.body', 'body': base64.b64decode(record['body_b64'])})
+
+    async def _send_conflict(self, send):
+        body = b'{"detail":"Idempotency-Key reused with a different request body"}'
+        await send({
+            'type': 'http.response.start',
+            'status': 422,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
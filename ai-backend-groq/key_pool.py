@@ -0,0 +1,177 @@
+import os
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Pool de API keys de Groq: cada petición usa la key con más margen según las cabeceras
+# x-ratelimit-* de Groq; una key que recibe 429 queda apartada hasta que se recupere.
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def parse_duration(value):
+    """Groq reset headers ('2m59.56s', '7.66s', '120ms') -> seconds, None if unparseable."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _UNITS[unit] for number, unit in parts)
+
+
+def _mask(key):
+    return f"{key[:4]}…{key[-4:]}" if len(key) > 12 else '…'
+
+
+class KeyPool:
+    """
+    Thread-safe set of API keys with per-key rate-limit state. Use call()
+    (or acquire()/release()) around every upstream request.
+    """
+
+    def __init__(self, keys, bench_seconds=None):
+        self.keys = list(dict.fromkeys(k.strip() for k in keys if k and k.strip()))
+        self.bench_seconds = bench_seconds if bench_seconds is not None else float(os.getenv('GROQ_KEY_BENCH_SECONDS', 20))
+        self.lock = threading.Lock()
+        self.state = {key: {
+            'remaining_requests': None,
+            'remaining_tokens': None,
+            'reset_at': 0.0,
+            'benched_until': 0.0,
+            'inflight': 0,
+            'requests': 0,
+            'rate_limited': 0,
+            'errors': 0
+        } for key in self.keys}
+
+    @classmethod
+    def from_env(cls):
+        """GROQ_API_KEYS (comma separated) plus GROQ_API_KEY."""
+        keys = os.getenv('GROQ_API_KEYS', '').split(',') + [os.getenv('GROQ_API_KEY', '')]
+        return cls(keys)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def _headroom(self, state, now):
+        # Cifras caducadas (ya pasó el reset) o desconocidas cuentan como margen completo
+        if state['remaining_requests'] is None or now >= state['reset_at']:
+            requests_left = float('inf')
+        else:
+            requests_left = state['remaining_requests']
+        tokens_left = state['remaining_tokens'] if state['remaining_tokens'] is not None and now < state['reset_at'] else float('inf')
+        # inf - inflight sigue siendo inf: el desempate por peticiones en curso reparte las ráfagas
+        return (requests_left - state['inflight'], tokens_left, -state['inflight'])
+
+    def acquire(self, exclude=(), available_only=False):
+        """
+        Key with the most headroom among the non-benched ones; if all are
+        benched, the one back soonest (or None with available_only).
+        """
+        if not self.keys:
+            return None
+        now = time.time()
+        with self.lock:
+            candidates = [k for k in self.keys if k not in exclude]
+            available = [k for k in candidates if self.state[k]['benched_until'] <= now]
+            if available:
+                key = max(available, key=lambda k: self._headroom(self.state[k], now))
+            elif available_only or not candidates:
+                return None
+            else:
+                key = min(candidates, key=lambda k: self.state[k]['benched_until'])
+            self.state[key]['inflight'] += 1
+            self.state[key]['requests'] += 1
+            return key
+
+    def release(self, key, status_code=None, headers=None):
+        """Updates the key from the response status and x-ratelimit-* headers."""
+        if key not in self.state:
+            return
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        now = time.time()
+        with self.lock:
+            state = self.state[key]
+            state['inflight'] = max(0, state['inflight'] - 1)
+            if status_code is None or status_code >= 500:
+                state['errors'] += 1
+
+            for field, header in (('remaining_requests', 'x-ratelimit-remaining-requests'),
+                                  ('remaining_tokens', 'x-ratelimit-remaining-tokens')):
+                if header in headers:
+                    try:
+                        state[field] = int(float(headers[header]))
+                    except ValueError:
+                        pass
+            resets = [parse_duration(headers.get(h)) for h in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')]
+            resets = [r for r in resets if r is not None]
+            if resets:
+                state['reset_at'] = now + max(resets)
+
+            if status_code == 429:
+                state['rate_limited'] += 1
+                wait = parse_duration(headers.get('retry-after'))
+                state['benched_until'] = now + (wait if wait is not None else self.bench_seconds)
+                logger.warning(f"🚦 Groq key {_mask(key)} rate limited, benched for "
+                               f"{round(state['benched_until'] - now, 1)}s")
+
+    def call(self, send):
+        """
+        Runs send(api_key) -> response with the best key; on 429 it retries once
+        with another key if the pool has one.
+        """
+        key = self.acquire()
+        response = self._send(send, key)
+        if response.status_code == 429:
+            retry_key = self.acquire(exclude=(key,), available_only=True)
+            if retry_key is not None:
+                response = self._send(send, retry_key)
+        return response
+
+    def _send(self, send, key):
+        try:
+            response = send(key)
+        except Exception:
+            self.release(key)
+            raise
+        self.release(key, response.status_code, getattr(response, 'headers', None))
+        return response
+
+    def snapshot(self):
+        now = time.time()
+        with self.lock:
+            return {
+                'keys': len(self.keys),
+                'available': sum(1 for s in self.state.values() if s['benched_until'] <= now),
+                'per_key': {
+                    _mask(key): {
+                        **{k: v for k, v in s.items() if k not in ('reset_at', 'benched_until')},
+                        'benched_for_s': max(0.0, round(s['benched_until'] - now, 1)),
+                        'reset_in_s': max(0.0, round(s['reset_at'] - now, 1))
+                    } for key, s in self.state.items()
+                }
+            }
+
+
+def default_pool():
+    """Process-wide pool shared by app.py and generate_assets.py (built on first use, after load_dotenv)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = KeyPool.from_env()
+        return _default
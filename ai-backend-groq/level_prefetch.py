@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from collections import OrderedDict
+
+from vocabulary_index import normalize
+
+logger = logging.getLogger(__name__)
+
+
+def compatible(predicted, request, default_targets):
+    """
+    Whether a level generated for `predicted` is a valid answer to `request`:
+    same game parameters, and a target the request could have produced
+    (its explicit target, one of its mistakes, or one of the default letters).
+    """
+    if (predicted.gameType, predicted.difficulty, predicted.limit) != (request.gameType, request.difficulty, request.limit):
+        return False
+    if request.gameType != 'phoneme':
+        return True
+    target = normalize(predicted.target or '')
+    if request.target:
+        return normalize(request.target) == target
+    mistakes = (request.performance_context or {}).get('mistakes') or []
+    if mistakes:
+        return target in {normalize(m) for m in mistakes if m}
+    return target in {normalize(t) for t in default_targets}
+
+
+class LevelPrefetcher:
+    """
+    One speculative next level per session (bounded LRU). schedule() starts
+    building it in the background; take() hands it out once if it still
+    matches the follow-up request and is younger than the TTL.
+    """
+
+    def __init__(self, ttl_seconds=None, max_sessions=None):
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv('PREFETCH_TTL', 300))
+        self.max_sessions = max_sessions or int(os.getenv('PREFETCH_MAX_SESSIONS', 256))
+        self.entries = OrderedDict()  # session_id -> {'request', 'task', 'created'}
+        self.stats = {'scheduled': 0, 'hits': 0, 'inflight_hits': 0, 'misses': 0,
+                      'stale': 0, 'mismatch': 0, 'failed': 0, 'evicted': 0}
+
+    def _discard(self, session_id):
+        entry = self.entries.pop(session_id, None)
+        if entry is not None and not entry['task'].done():
+            entry['task'].cancel()
+
+    def _on_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.stats['failed'] += 1
+            logger.warning(f"⚠️ Level prefetch failed: {task.exception()}")
+
+    def schedule(self, session_id, predicted, build):
+        """Starts build(predicted) in the background, replacing the session's previous speculation."""
+        self._discard(session_id)
+        # Contexto vacío: sin el X-Request-ID ni el Server-Timing de la petición que lo dispara
+        task = asyncio.create_task(build(predicted), context=contextvars.Context())
+        task.add_done_callback(self._on_done)
+        self.entries[session_id] = {'request': predicted, 'task': task, 'created': time.monotonic()}
+        self.stats['scheduled'] += 1
+        while len(self.entries) > self.max_sessions:
+            oldest = next(iter(self.entries))
+            self._discard(oldest)
+            self.stats['evicted'] += 1
+
+    async def take(self, session_id, request, default_targets):
+        """The speculated result for this request, or None (then generate it live)."""
+        entry = self.entries.pop(session_id, None)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+
+        task = entry['task']
+        if time.monotonic() - entry['created'] > self.ttl_seconds:
+            reason = 'stale'
+        elif not compatible(entry['request'], request, default_targets):
+            reason = 'mismatch'
+        else:
+            reason = None
+        if reason:
+            self.stats[reason] += 1
+            self.stats['misses'] += 1
+            if not task.done():
+                task.cancel()
+            return None
+
+        inflight = not task.done()
+        try:
+            # shield: si el cliente se va, la generación sigue (y se descarta sin más)
+            result = await asyncio.shield(task)
+        except Exception:
+            self.stats['misses'] += 1
+            return None
+        self.stats['inflight_hits' if inflight else 'hits'] += 1
+        return result
+
+    def export_entries(self):
+        """Finished speculations as [session_id, expires_at, request_fields, result] (for warm_snapshot)."""
+        now, wall = time.monotonic(), time.time()
+        entries = []
+        for session_id, entry in self.entries.items():
+            task = entry['task']
+            remaining = self.ttl_seconds - (now - entry['created'])
+            if remaining <= 0 or not task.done() or task.cancelled() or task.exception() is not None:
+                continue
+            request = entry['request']
+            fields = request.model_dump() if hasattr(request, 'model_dump') else dict(vars(request))
+            entries.append([session_id, wall + remaining, fields, task.result()])
+        return entries
+
+    def import_entries(self, entries, parse_request):
+        """
+        Restores exported speculations (expired ones are dropped) as already
+        finished builds; `parse_request` turns the saved fields back into a
+        request. Returns how many were loaded.
+        """
+        now, wall = time.monotonic(), time.time()
+        loaded = 0
+        for session_id, expires_at, fields, result in entries:
+            if expires_at <= wall or session_id in self.entries:
+                continue
+            task = asyncio.get_running_loop().create_future()
+            task.set_result(result)
+            self.entries[session_id] = {'request': parse_request(fields), 'task': task,
+                                        'created': now - (self.ttl_seconds - (expires_at - wall))}
+            loaded += 1
+        while len(self.entries) > self.max_sessions:
+            self.entries.popitem(last=False)
+        return loaded
+
+    def snapshot_stats(self):
+        served = self.stats['hits'] + self.stats['inflight_hits']
+        total = served + self.stats['misses']
+        return {**self.stats, 'sessions': len(self.entries),
+                'hit_rate': round(served / total, 3) if total else None}
@@ -0,0 +1,212 @@
+import re
+import json
+
+from vocabulary_index import normalize, is_valid_word
+
+MAX_DISTRACTORS = 3
+
+_MATH_EXPRESSION = re.compile(r'^\s*\d+(\s*[+\-]\s*\d+)+\s*$')
+_MATH_TERM = re.compile(r'([+\-]?)\s*(\d+)')
+
+
+def parse_level_items(content):
+    """
+    LLM content -> list of items. Strips code fences and unwraps
+    {"levels": [...]}-style objects; raises ValueError if no list is found.
+    """
+    # Llama sometimes wraps in ```json ... ```
+    clean_content = content.replace("```json", "").replace("```", "").strip()
+    data = json.loads(clean_content)
+
+    # If wrapped in object key usually "levels" or "items"
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, list):
+                return value
+        raise ValueError("JSON object without a list of items")
+    if not isinstance(data, list):
+        raise ValueError("JSON is not a list of items")
+    return data
+
+
+def new_stats():
+    return {
+        'received': 0,
+        'accepted': 0,
+        'rejected': {},
+        'repair_rounds': 0,
+        'repaired_items': 0
+    }
+
+
+def _reject(stats, reason):
+    stats['rejected'][reason] = stats['rejected'].get(reason, 0) + 1
+
+
+def validate_phoneme_level(items, target, limit, stats=None):
+    """
+    Keeps items that are well formed, whose isTarget flag matches the initial
+    letter, not duplicated, within `limit` and with at most 3 distractors
+    (leaving room for at least one). Returns (valid_items, stats).
+    """
+    stats = stats or new_stats()
+    prefix = normalize(target)
+    valid = []
+    seen = set()
+    targets = distractors = 0
+
+    for item in items:
+        stats['received'] += 1
+        if not isinstance(item, dict):
+            _reject(stats, 'malformed')
+            continue
+        word = item.get('word')
+        # Validation: Filter out None, empty strings, string "None", or containing 'ñ'
+        if not is_valid_word(word):
+            _reject(stats, 'invalid_word')
+            continue
+        word = str(word).strip()
+        key = normalize(word)
+        if key in seen:
+            _reject(stats, 'duplicate')
+            continue
+
+        is_target = item.get('isTarget') is True
+        starts = key.startswith(prefix)
+        if is_target and not starts:
+            _reject(stats, 'target_mismatch')
+            continue
+        if not is_target and starts:
+            _reject(stats, 'distractor_mismatch')
+            continue
+
+        if len(valid) >= limit:
+            _reject(stats, 'over_limit')
+            continue
+        if is_target and targets >= max(limit - 1, 1):
+            _reject(stats, 'too_many_targets')
+            continue
+        if not is_target and distractors >= MAX_DISTRACTORS:
+            _reject(stats, 'too_many_distractors')
+            continue
+
+        seen.add(key)
+        targets += is_target
+        distractors += not is_target
+        valid.append({**item, 'word': word, 'icon': str(item.get('icon') or word).strip().lower(), 'isTarget': is_target})
+
+    stats['accepted'] = len(valid)
+    return valid, stats
+
+
+def _evaluate(expression):
+    total = 0
+    for sign, number in _MATH_TERM.findall(expression):
+        total += -int(number) if sign == '-' else int(number)
+    return total
+
+
+def validate_math_level(items, limit, stats=None):
+    """
+    Keeps addition/subtraction items whose answer is correct and non-negative,
+    without duplicated questions and within `limit`.
+    """
+    stats = stats or new_stats()
+    valid = []
+    seen = set()
+
+    for item in items:
+        stats['received'] += 1
+        if not isinstance(item, dict) or not isinstance(item.get('q'), str):
+            _reject(stats, 'malformed')
+            continue
+        question = item['q'].strip()
+        if not _MATH_EXPRESSION.match(question):
+            _reject(stats, 'malformed')
+            continue
+        key = question.replace(' ', '')
+        if key in seen:
+            _reject(stats, 'duplicate')
+            continue
+        expected = _evaluate(question)
+        try:
+            answer = int(item.get('a'))
+        except (TypeError, ValueError):
+            answer = None
+        if answer != expected or expected < 0:
+            _reject(stats, 'wrong_answer')
+            continue
+        if len(valid) >= limit:
+            _reject(stats, 'over_limit')
+            continue
+
+        seen.add(key)
+        valid.append({**item, 'q': question, 'a': answer})
+
+    stats['accepted'] = len(valid)
+    return valid, stats
+
+
+def math_level_prompt(difficulty, limit):
+    return f"""
+        Generate {limit} {difficulty} math problems for a 5-7 year old. 
+        Operations: Addition/Subtraction.
+        Format: JSON Array only.
+        Example: [{{"q": "2 + 2", "a": 4, "ops": "+"}}]
+        Response must be ONLY valid JSON.
+        """
+
+
+def phoneme_level_prompt(target, limit):
+    """Full-level prompt; the target letter is already resolved by the caller."""
+    target_instruction = f"ALL correct words MUST start with the Spanish letter '{target}'."
+    distractor_instruction = f"Generate 1-3 distractor words that do NOT start with '{target}'."
+
+    return f"""
+        Generate a phoneme identification game level in Spanish.
+        Target Phoneme: "{target}"
+        {target_instruction}
+        {distractor_instruction}
+        
+        Return exactly {limit} items total (including the distractor).
+        Structure:
+        [
+          {{ "word": "Mesa", "icon": "mesa", "isTarget": true }},
+          {{ "word": "Sol", "icon": "sol", "isTarget": false }}
+        ]
+        
+        CRITICAL: 
+        1. "isTarget" must be true ONLY for words starting with '{target}'.
+        2. "isTarget" must be false for the distractor.
+        3. Simple vocabulary for a 5-7 year-old.
+        4. Do NOT use words containing the letter "Ñ" (e.g. avoid Niña, Piña).
+        5. Response must be ONLY valid JSON array.
+        """
+
+
+def phoneme_repair_prompt(valid, target, limit):
+    """Asks only for the missing items, listing the words already used."""
+    distractors = sum(1 for item in valid if not item['isTarget'])
+    missing = limit - len(valid)
+    missing_distractors = min(missing, max(0, 1 - distractors))
+    missing_targets = missing - missing_distractors
+    used = ', '.join(item['word'] for item in valid) or 'none'
+
+    return f"""
+        Return ONLY a JSON array with exactly {missing} new Spanish words for a 5-7 year-old:
+        - {missing_targets} words starting with '{target}' ("isTarget": true)
+        - {missing_distractors} words NOT starting with '{target}' ("isTarget": false)
+        Do NOT use any of: {used}. Do NOT use words containing "Ñ".
+        Format: [{{ "word": "Mesa", "icon": "mesa", "isTarget": true }}]
+        """
+
+
+def math_repair_prompt(valid, difficulty, limit):
+    missing = limit - len(valid)
+    used = ', '.join(item['q'] for item in valid) or 'none'
+
+    return f"""
+        Return ONLY a JSON array with exactly {missing} new {difficulty} addition/subtraction problems for a 5-7 year old.
+        Answers must be correct and not negative. Do NOT repeat: {used}.
+        Format: [{{"q": "2 + 2", "a": 4, "ops": "+"}}]
+        """
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+from startup import lazy_import
+from request_timing import stage
+import cassette
+from key_pool import KeyPool
+
+logger = logging.getLogger(__name__)
+
+# Tabla de rutas por tarea: modelo, límites de salida y modelo de respaldo.
+# Se puede sobreescribir por tarea con MODEL_ROUTES (JSON) o MODEL_ROUTES_FILE.
+DEFAULT_ROUTES = {
+    'speaking-chat': {
+        'model': 'llama-3.1-8b-instant',
+        'max_tokens': 20,
+        'temperature': 0.8,
+        'timeout': 10,
+        'fallback': 'openai/gpt-oss-120b'
+    },
+    'phoneme-levels': {
+        'model': 'openai/gpt-oss-120b',
+        'max_tokens': 1024,
+        'temperature': 0.7,
+        'timeout': 30,
+        'fallback': 'llama-3.3-70b-versatile'
+    },
+    'math-levels': {
+        'model': 'openai/gpt-oss-120b',
+        'max_tokens': 1024,
+        'temperature': 0.7,
+        'timeout': 30,
+        'fallback': 'llama-3.3-70b-versatile'
+    },
+    'svg-icon': {
+        'model': 'openai/gpt-oss-120b',
+        'max_tokens': 4096,
+        'temperature': 0.2,
+        'timeout': 30,
+        'fallback': 'llama-3.3-70b-versatile'
+    },
+    'generate': {
+        'model': 'openai/gpt-oss-120b',
+        'max_tokens': 1024,
+        'temperature': 0.7,
+        'timeout': 30,
+        'fallback': None
+    },
+    'chat': {
+        'model': 'openai/gpt-oss-120b',
+        'max_tokens': 1024,
+        'temperature': 0.7,
+        'timeout': 30,
+        'fallback': None
+    }
+}
+
+LATENCY_WINDOW = 200
+
+
+class UpstreamError(Exception):
+    """Non-2xx response from the LLM provider."""
+
+    def __init__(self, status_code, detail):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+
+
+def load_routes():
+    routes = {task: dict(cfg) for task, cfg in DEFAULT_ROUTES.items()}
+
+    overrides = {}
+    routes_file = os.getenv('MODEL_ROUTES_FILE')
+    if routes_file:
+        try:
+            with open(routes_file, 'r', encoding='utf-8') as f:
+                overrides.update(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ MODEL_ROUTES_FILE inválido ({routes_file}): {e}")
+
+    routes_env = os.getenv('MODEL_ROUTES')
+    if routes_env:
+        try:
+            overrides.update(json.loads(routes_env))
+        except ValueError as e:
+            logger.warning(f"⚠️ MODEL_ROUTES inválido: {e}")
+
+    for task, cfg in overrides.items():
+        if not isinstance(cfg, dict):
+            continue
+        routes.setdefault(task, dict(DEFAULT_ROUTES['generate'])).update(cfg)
+
+    return routes
+
+
+_routes = None
+_routes_lock = threading.Lock()
+
+_stats_lock = threading.Lock()
+_stats = {}  # task -> model -> stats dict
+
+
+def routes():
+    """Route table, loaded on first use (after load_dotenv, so MODEL_ROUTES from .env applies)."""
+    global _routes
+    if _routes is None:
+        with _routes_lock:
+            if _routes is None:
+                _routes = load_routes()
+    return _routes
+
+
+def get_route(task):
+    table = routes()
+    return table.get(task) or table['generate']
+
+
+def _record(task, model, latency_ms, ok, usage=None, timed_out=False, fallback=False):
+    with _stats_lock:
+        stats = _stats.setdefault(task, {}).setdefault(model, {
+            'calls': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'fallback_calls': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'latencies_ms': deque(maxlen=LATENCY_WINDOW)
+        })
+        stats['calls'] += 1
+        if not ok:
+            stats['errors'] += 1
+        if timed_out:
+            stats['timeouts'] += 1
+        if fallback:
+            stats['fallback_calls'] += 1
+        if usage:
+            stats['prompt_tokens'] += usage.get('prompt_tokens', 0) or 0
+            stats['completion_tokens'] += usage.get('completion_tokens', 0) or 0
+        stats['latencies_ms'].append(latency_ms)
+
+
+def _headers(api_key):
+    headers = {'Content-Type': 'application/json'}
+    if api_key:
+        headers['Authorization'] = f'Bearer {api_key}'
+    return headers
+
+
+def _post_completion(task, model, messages, api_url, api_key, temperature, max_tokens, timeout, extra, fallback):
+    payload = {
+        'model': model,
+        'messages': messages,
+        'temperature': temperature,
+        'max_tokens': max_tokens
+    }
+    if extra:
+        payload.update(extra)
+
+    requests = lazy_import('requests')
+    started = time.perf_counter()
+    try:
+        with stage('upstream'):
+            def send(key):
+                return cassette.post('chat', f'{api_url}/chat/completions', headers=_headers(key), json=payload, timeout=timeout)
+
+            # Con un KeyPool se usa la key con más margen (y otra si esta devuelve 429)
+            response = api_key.call(send) if isinstance(api_key, KeyPool) else send(api_key)
+    except requests.Timeout:
+        _record(task, model, (time.perf_counter() - started) * 1000, ok=False, timed_out=True, fallback=fallback)
+        raise
+    except Exception:
+        _record(task, model, (time.perf_counter() - started) * 1000, ok=False, fallback=fallback)
+        raise
+
+    latency_ms = (time.perf_counter() - started) * 1000
+    if not response.ok:
+        _record(task, model, latency_ms, ok=False, fallback=fallback)
+        raise UpstreamError(response.status_code, response.text)
+
+    result = response.json()
+    _record(task, model, latency_ms, ok=True, usage=result.get('usage'), fallback=fallback)
+    return result
+
+
+def chat_completion(task, messages, api_url, api_key, model=None, temperature=None,
+                    max_tokens=None, extra=None):
+    """
+    Blocking chat completion routed by task. Explicit arguments override the
+    route; on error or timeout the route's fallback model is tried once.
+    `api_key` may be a single key or a KeyPool.
+
+    Returns (result_json, model_used).
+    """
+    requests = lazy_import('requests')
+    route = get_route(task)
+    primary = model or route['model']
+    options = {
+        'temperature': route['temperature'] if temperature is None else temperature,
+        'max_tokens': route['max_tokens'] if max_tokens is None else max_tokens,
+        'timeout': route.get('timeout', 30),
+        'extra': extra
+    }
+
+    try:
+        return _post_completion(task, primary, messages, api_url, api_key, fallback=False, **options), primary
+    except (UpstreamError, requests.RequestException) as e:
+        fallback_model = route.get('fallback')
+        if not fallback_model or fallback_model == primary:
+            raise
+        logger.warning(f"↪️ Route '{task}': {primary} failed ({e}), retrying with {fallback_model}")
+        return _post_completion(task, fallback_model, messages, api_url, api_key, fallback=True, **options), fallback_model
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 1)
+
+
+def routes_snapshot():
+    """Route table plus per-route, per-model latency and token stats."""
+    with _stats_lock:
+        stats = {
+            task: {
+                model: {
+                    **{k: v for k, v in s.items() if k != 'latencies_ms'},
+                    'latency_p50_ms': _percentile(s['latencies_ms'], 50),
+                    'latency_p95_ms': _percentile(s['latencies_ms'], 95)
+                }
+                for model, s in models.items()
+            }
+            for task, models in _stats.items()
+        }
+    return {'routes': routes(), 'stats': stats}
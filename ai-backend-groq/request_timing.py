@@ -0,0 +1,164 @@
+import os
+import sys
+import hmac
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from structured_logging import request_id_var
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b'x-profile'
+PROFILE_ID_HEADER = b'x-profile-id'
+
+# Duraciones por etapa de la petición en curso: {'upstream': 812.4, 'parse': 0.6}
+_stages_var = ContextVar('request_stages', default=None)
+
+# Frames de espera: hilos ociosos del pool / del event loop, no trabajo de la petición
+_IDLE_FILES = ('threading.py', 'selectors.py', 'queue.py')
+
+_profile_lock = threading.Lock()
+
+
+def record(name, ms):
+    """Adds `ms` to stage `name` of the current request (no-op outside a request)."""
+    stages = _stages_var.get()
+    if stages is not None:
+        stages[name] = stages.get(name, 0.0) + ms
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a block as a Server-Timing stage. Works in threads started with
+    asyncio.to_thread (the context is copied); repeated stages add up.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+
+
+def server_timing_header(stages, total_ms):
+    parts = [f"{name};dur={ms:.1f}" for name, ms in stages.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ', '.join(parts)
+
+
+class StackSampler(threading.Thread):
+    """
+    Minimal sampling profiler: every `interval` seconds it folds the stack of
+    every busy thread into 'a;b;c' keys (flamegraph/speedscope format).
+    """
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True, name='request-profiler')
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me or os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.samples
+
+
+def _profile_dir():
+    return os.getenv('PROFILE_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'profiles')
+
+
+def _write_profile(samples, profile_id):
+    directory = _profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{profile_id}.folded")
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that adds a Server-Timing header with the stages recorded
+    through `stage()` plus the total time until the response started.
+
+    A caller sending 'X-Profile: <PROFILE_TOKEN>' also gets the request
+    sampled (PROFILE_INTERVAL_MS) into PROFILE_DIR/<id>.folded; the id is
+    returned in 'X-Profile-Id'. Without PROFILE_TOKEN profiling is disabled,
+    and only one request is profiled at a time. Samples cover every thread,
+    so concurrent requests show up too.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wants_profile(self, scope):
+        token = os.getenv('PROFILE_TOKEN', '')
+        if not token:
+            return False
+        for name, value in scope.get('headers', []):
+            if name == PROFILE_HEADER:
+                return hmac.compare_digest(value, token.encode('latin-1'))
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        stages = {}
+        token = _stages_var.set(stages)
+        started = time.perf_counter()
+
+        sampler = None
+        profile_id = None
+        if self._wants_profile(scope):
+            if _profile_lock.acquire(blocking=False):
+                profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{request_id_var.get() or 'req'}"
+                sampler = StackSampler(float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000)
+                sampler.start()
+            else:
+                logger.info("⏱️ Profiler busy, request not profiled")
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                total_ms = (time.perf_counter() - started) * 1000
+                headers.append((b'server-timing', server_timing_header(stages, total_ms).encode('latin-1')))
+                if profile_id:
+                    headers.append((PROFILE_ID_HEADER, profile_id.encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stages_var.reset(token)
+            if sampler is not None:
+                try:
+                    samples = await asyncio.to_thread(sampler.stop)
+                    path = await asyncio.to_thread(_write_profile, samples, profile_id)
+                    logger.info(f"⏱️ Profile saved: {path}", extra={'samples': sum(samples.values())})
+                except OSError as e:
+                    logger.warning(f"⚠️ Profile not saved: {e}")
+                finally:
+                    _profile_lock.release()
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import importlib
+import threading
+
+# El reloj arranca cuando app.py importa este módulo (antes que FastAPI)
+STARTED_AT = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+_marks = []          # [(label, ms since start)]
+_imports = {}        # module -> ms spent importing it lazily
+_warmups = []        # [(name, fn)]
+_warmup_results = {}  # name -> {'ms': ..., 'error': ...}
+_first_request_ms = None
+_import_lock = threading.Lock()
+_loaded = set()      # modules fully imported through lazy_import
+
+ready = threading.Event()
+
+
+def _profiling():
+    # Se lee en cada uso: este módulo se importa antes de load_dotenv()
+    return os.getenv('STARTUP_PROFILE', '0') == '1'
+
+
+def _elapsed_ms():
+    return round((time.perf_counter() - STARTED_AT) * 1000, 1)
+
+
+def mark(label):
+    """Records a named point of the startup timeline."""
+    _marks.append((label, _elapsed_ms()))
+
+
+def lazy_import(module_name):
+    """
+    Imports `module_name` on first use and records how long it took, so heavy
+    dependencies (gtts, requests, generate_assets...) stay off the cold path.
+    """
+    # Atajo solo para módulos que ya terminaron de importarse por aquí: mientras otro hilo
+    # (el warm-up) lo importa, sys.modules tiene el módulo a medio inicializar.
+    if module_name in _loaded:
+        return sys.modules[module_name]
+    started = time.perf_counter()
+    # import_module espera al lock del módulo si otro hilo lo está importando
+    module = importlib.import_module(module_name)
+    with _import_lock:
+        _imports.setdefault(module_name, round((time.perf_counter() - started) * 1000, 1))
+        _loaded.add(module_name)
+    return module
+
+
+def register_warmup(name, fn):
+    """Registers a blocking step to run in the background once the server is listening."""
+    _warmups.append((name, fn))
+
+
+async def run_warmups():
+    """Runs every registered warm-up step in a worker thread, then flags readiness."""
+    if os.getenv('WARMUP_ON_START', '1') == '1':
+        for name, fn in _warmups:
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(fn)
+                _warmup_results[name] = {'ms': round((time.perf_counter() - started) * 1000, 1)}
+            except Exception as e:
+                logger.warning(f"⚠️ Warm-up '{name}' failed: {e}")
+                _warmup_results[name] = {'ms': round((time.perf_counter() - started) * 1000, 1), 'error': str(e)}
+    mark('ready')
+    ready.set()
+
+    if _profiling():
+        logger.info("⏱️ Startup profile", extra={'startup': report()})
+
+
+def report():
+    return {
+        'ready': ready.is_set(),
+        'marks_ms': dict(_marks),
+        'lazy_imports_ms': dict(_imports),
+        'warmups': dict(_warmup_results),
+        'first_request_ms': _first_request_ms
+    }
+
+
+class FirstRequestTimer:
+    """ASGI middleware that records time-to-first-request since process start."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _first_request_ms
+        if _first_request_ms is None and scope['type'] == 'http':
+            _first_request_ms = _elapsed_ms()
+            if _profiling():
+                logger.info(f"⏱️ First request after {_first_request_ms} ms: {scope.get('path')}")
+        await self.app(scope, receive, send)
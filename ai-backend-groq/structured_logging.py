@@ -0,0 +1,212 @@
+import os
+import re
+import copy
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+import traceback
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+request_id_var = ContextVar('request_id', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+_VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Atributos estándar de LogRecord: todo lo demás se trata como campo extra
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id', 'exc', 'sample'}
+
+_listener = None
+
+
+def _truncate(value, limit):
+    if isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}…(+{len(value) - limit} chars)"
+    return value
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through only a fraction of records that carry `sample=True`
+    (noisy per-item logs); everything else passes untouched.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if getattr(record, 'sample', False) and self.rate < 1.0:
+            return random.random() < self.rate
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Se formatea en el hilo que emite; la traza viaja aparte para
+        # poder recortarla por el final
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc = ''.join(traceback.format_exception(*record.exc_info))
+            record.exc_info = None
+            record.exc_text = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    def __init__(self, max_field_chars=1000):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': _truncate(record.getMessage(), self.max_field_chars),
+            'request_id': getattr(record, 'request_id', None)
+        }
+        for key, value in record.__dict__.items():
+            if key in _RESERVED or key.startswith('_'):
+                continue
+            if not isinstance(value, (str, int, float, bool, type(None), list, dict)):
+                value = repr(value)
+            elif isinstance(value, (list, dict)):
+                value = _truncate(json.dumps(value, ensure_ascii=False, default=str), self.max_field_chars)
+            entry[key] = _truncate(value, self.max_field_chars)
+        exc = getattr(record, 'exc', None)
+        if exc:
+            # Las trazas se recortan por el final, que es donde está el error
+            entry['exc'] = exc[-self.max_field_chars * 4:]
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self, max_field_chars=1000):
+        super().__init__('%(message)s')
+        self.max_field_chars = max_field_chars
+
+    def format(self, record):
+        line = _truncate(record.getMessage(), self.max_field_chars)
+        exc = getattr(record, 'exc', None)
+        if exc:
+            line = f"{line}\n{exc[-self.max_field_chars * 4:].rstrip()}"
+        return line
+
+
+def _parse_levels(spec):
+    """'model_routing=DEBUG,uvicorn.access=WARNING' -> {logger: level}"""
+    levels = {}
+    for part in (spec or '').split(','):
+        if '=' not in part:
+            continue
+        name, level = part.split('=', 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(default_format='json'):
+    """
+    Routes every log record through a QueueHandler so request handlers never
+    block on stdout; a background QueueListener does the actual I/O.
+
+    Env: LOG_LEVEL, LOG_LEVELS (per module), LOG_FORMAT (json|text),
+    LOG_MAX_FIELD_CHARS, LOG_SAMPLE_RATE.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    max_chars = int(os.getenv('LOG_MAX_FIELD_CHARS', 1000))
+    fmt = os.getenv('LOG_FORMAT', default_format).lower()
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JSONFormatter(max_chars) if fmt == 'json' else TextFormatter(max_chars))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    # El request_id se captura en el hilo que emite, no en el listener
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(SamplingFilter(float(os.getenv('LOG_SAMPLE_RATE', 1.0))))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+
+    for name, level in _parse_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def new_request_id(incoming=None):
+    if incoming and _VALID_REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+class RequestIdMiddleware:
+    """
+    ASGI middleware: assigns a request ID (reusing a sane incoming
+    X-Request-ID), exposes it to loggers, returns it as a response header
+    and writes one access line per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger('access')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] not in ('http', 'websocket'):
+            return await self.app(scope, receive, send)
+
+        incoming = None
+        for name, value in scope.get('headers', []):
+            if name == b'x-request-id':
+                incoming = value.decode('latin-1')
+                break
+        request_id = new_request_id(incoming)
+        token = request_id_var.set(request_id)
+        started = time.perf_counter()
+        status = {'code': None}
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                headers = list(message.get('headers', []))
+                headers.append((REQUEST_ID_HEADER.lower().encode(), request_id.encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.logger.info(
+                f"{scope.get('method', 'WS')} {scope.get('path')} {status['code']}",
+                extra={
+                    'method': scope.get('method', 'WS'),
+                    'path': scope.get('path'),
+                    'status': status['code'],
+                    'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+                }
+            )
+            request_id_var.reset(token)
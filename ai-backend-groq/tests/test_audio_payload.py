@@ -0,0 +1,50 @@
+import os
+import sys
+import json
+import base64
+import asyncio
+import binascii
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from audio_payload import read_json_audio, decode_audio, digest
+
+
+def _read(body, chunk_size=7, **kwargs):
+    async def chunks():
+        for i in range(0, len(body), chunk_size):
+            yield body[i:i + chunk_size]
+    return asyncio.run(read_json_audio(chunks(), **kwargs))
+
+
+def test_streamed_decode_matches_decode_audio():
+    raw = bytes(range(256)) * 40
+    encoded = 'data:audio/wav;base64,' + base64.b64encode(raw).decode()
+    body = json.dumps({'format': 'webm', 'audio': encoded, 'language': 'en'}).encode()
+    # Trozos pequeños: prefijo, cuartetos y campos partidos entre trozos
+    fields, audio = _read(body)
+    with audio:
+        assert fields == {'format': 'webm', 'language': 'en'}
+        assert audio.read() == raw == decode_audio(encoded)
+        assert digest(audio) == digest(raw)
+
+
+def test_escapes_whitespace_and_spill():
+    raw = os.urandom(3000)
+    encoded = base64.encodebytes(raw).decode()  # con saltos de línea cada 76 caracteres
+    body = json.dumps({'audio': encoded}).replace('/', '\\/').encode()
+    fields, audio = _read(body, chunk_size=100, spool_bytes=1024)
+    with audio:
+        assert audio.spilled and audio.read() == raw
+
+
+def test_missing_field_and_malformed_bodies():
+    fields, audio = _read(b'{"audio": null, "format": "wav"}')
+    assert audio is None and fields == {'audio': None, 'format': 'wav'}
+    for body in (b'{"audio": "abcd"', b'{"audio": "abcd"} x', b'[1]', b'{"audio": "ab\\u0041"}'):
+        with pytest.raises(ValueError):
+            _read(body)
+    with pytest.raises(binascii.Error):
+        _read(b'{"audio": "abc"}')
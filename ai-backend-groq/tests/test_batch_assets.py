@@ -0,0 +1,46 @@
+import os
+import sys
+import json
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_assets
+
+
+def test_batch_skips_existing_and_resumes(monkeypatch):
+    attempts = {}
+
+    def fake_generate(word, output_path):
+        attempts[word] = attempts.get(word, 0) + 1
+        if word == 'lobo' and attempts[word] == 1:
+            return False
+        with open(output_path, 'w') as f:
+            f.write('<svg xmlns="http://www.w3.org/2000/svg"></svg>')
+        return True
+
+    monkeypatch.setattr(generate_assets, 'generate_svg_with_llm', fake_generate)
+    monkeypatch.setattr(generate_assets.time, 'sleep', lambda s: None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        with open(os.path.join(tmp, 'sol.svg'), 'w') as f:
+            f.write('<svg/>')
+        words_file = os.path.join(tmp, 'words.txt')
+        with open(words_file, 'w') as f:
+            f.write("Sol\nmesa\n# comentario\nlobo\nmesa\n")
+
+        words = generate_assets.read_word_list(words_file)
+        assert words == ['sol', 'mesa', 'lobo']
+
+        summary = generate_assets.run_batch(words, tmp, workers=2, rate=0, max_retries=1)
+        assert summary == {'skipped': 1, 'done': 2}
+        assert 'sol' not in attempts
+
+        with open(os.path.join(tmp, '.batch_manifest.json')) as f:
+            manifest = json.load(f)['words']
+        assert manifest['lobo']['retries'] == 1
+        assert manifest['mesa']['bytes'] > 0
+
+        # Segunda pasada: todo existe, no se llama al LLM
+        generate_assets.run_batch(words, tmp, workers=2, rate=0)
+        assert attempts == {'mesa': 1, 'lobo': 2}
@@ -0,0 +1,37 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_hot_paths import build_cases, measure, regressions, main
+
+
+def test_cases_run_on_fixtures():
+    cases = build_cases()
+    assert {stage for stage, _, _ in cases} == {'parse', 'validation', 'prompt', 'svg', 'decode'}
+    for _, _, fn in cases:
+        fn()
+    result = measure(cases[0][2], repeat=1, quick=True)
+    assert result['ops_per_sec'] > 0 and result['alloc_peak_kib'] >= 0
+
+
+def test_regressions_use_threshold():
+    baseline = {'a': {'ops_per_sec': 100.0}, 'b': {'ops_per_sec': 100.0}}
+    results = {'a': {'ops_per_sec': 80.0}, 'b': {'ops_per_sec': 70.0}, 'new': {'ops_per_sec': 1.0}}
+    assert regressions(results, baseline, 0.25) == {'b': 0.3}
+    assert regressions(results, {}, 0.25) == {}
+
+
+def test_cli_saves_and_compares_baseline(tmp_path, capsys):
+    baseline = str(tmp_path / 'baseline.json')
+    assert main(['--quick', '--save-baseline', '--baseline', baseline]) == 0
+    # Umbral imposible de superar (>100% más lento) -> sin regresiones
+    assert main(['--quick', '--baseline', baseline, '--threshold', '1.0']) == 0
+    assert 'vs baseline' in capsys.readouterr().out
+
+
+def test_cli_fails_without_baseline(tmp_path, capsys):
+    assert main(['--quick', '--baseline', str(tmp_path / 'missing.json')]) == 2
+    assert 'No baseline' in capsys.readouterr().out
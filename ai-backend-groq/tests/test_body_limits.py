@@ -0,0 +1,63 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from body_limits import BodyLimitMiddleware, parse_size
+
+
+def _call(middleware, path, chunks, content_length=None):
+    headers = [(b'content-length', str(content_length).encode())] if content_length is not None else []
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': headers}
+    pending = list(chunks)
+    sent = []
+
+    async def receive():
+        body = pending.pop(0)
+        return {'type': 'http.request', 'body': body, 'more_body': bool(pending)}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]['status'], pending
+
+
+async def _read_all(scope, receive, send):
+    more = True
+    while more:
+        message = await receive()
+        more = message.get('more_body', False)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'ok'})
+
+
+def test_per_route_limits():
+    middleware = BodyLimitMiddleware(_read_all, limits={'/transcribe': 100}, default_max_bytes=10)
+    assert _call(middleware, '/transcribe', [b'x' * 60, b'x' * 40])[0] == 200
+    assert _call(middleware, '/chat', [b'x' * 11])[0] == 413
+    # Content-Length: rechazo sin leer nada
+    status, pending = _call(middleware, '/transcribe/', [b'x' * 60, b'x' * 60], content_length=120)
+    assert status == 413 and len(pending) == 2
+    # Chunked: se corta en el primer trozo que pasa del límite
+    status, pending = _call(middleware, '/transcribe', [b'x' * 60, b'x' * 60, b'x' * 60])
+    assert status == 413 and len(pending) == 1
+
+
+def test_parse_size():
+    assert parse_size('16MB') == 16 * 1024 * 1024
+    assert parse_size('512k') == 512 * 1024
+    assert parse_size('1000') == 1000
+    assert parse_size('lots') is None
+
+
+def test_app_413_carries_cors_headers():
+    from fastapi.testclient import TestClient
+    import app as backend
+
+    client = TestClient(backend.app)
+    response = client.post('/api/generate', content=b'x' * (2 * 1024 * 1024),
+                           headers={'Origin': 'https://eduplay.example', 'Content-Type': 'application/json'})
+    assert response.status_code == 413
+    assert response.headers.get('access-control-allow-origin') in ('*', 'https://eduplay.example')
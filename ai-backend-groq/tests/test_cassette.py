@@ -0,0 +1,78 @@
+import os
+import sys
+import json as jsonlib
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import cassette
+import model_routing
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = jsonlib.dumps(body)
+
+    def json(self):
+        return jsonlib.loads(self.text)
+
+
+def test_record_then_replay_offline(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        monkeypatch.setenv('CASSETTE_DIR', tmp)
+        monkeypatch.setenv('CASSETTE_MODE', 'record')
+
+        def live_post(url, headers=None, json=None, timeout=None):
+            return FakeResponse(200, {'choices': [{'message': {'content': 'grabado'}}]})
+
+        monkeypatch.setattr(requests, 'post', live_post)
+        messages = [{'role': 'user', 'content': 'hola'}]
+        recorded, _ = model_routing.chat_completion('chat', messages, 'http://groq', 'key')
+        assert len(os.listdir(tmp)) == 1
+        assert 'key' not in open(os.path.join(tmp, os.listdir(tmp)[0])).read()
+
+        def offline(*args, **kwargs):
+            raise requests.ConnectionError("air-gapped")
+
+        monkeypatch.setattr(requests, 'post', offline)
+        monkeypatch.setenv('CASSETTE_MODE', 'replay')
+        replayed, _ = model_routing.chat_completion('chat', messages, 'http://groq', 'otra-key')
+        assert replayed == recorded
+
+        with pytest.raises(cassette.CassetteMiss):
+            model_routing.chat_completion('chat', [{'role': 'user', 'content': 'nuevo'}], 'http://groq', 'key')
+
+
+def test_bytes_replay(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        monkeypatch.setenv('CASSETTE_DIR', tmp)
+        monkeypatch.setenv('CASSETTE_MODE', 'record')
+        assert cassette.call_bytes('gtts', ['hola', 'es', False], lambda: b'MP3') == b'MP3'
+
+        monkeypatch.setenv('CASSETTE_MODE', 'replay')
+
+        def offline():
+            raise AssertionError("upstream called during replay")
+
+        assert cassette.call_bytes('gtts', ['hola', 'es', False], offline) == b'MP3'
+
+
+def test_replay_disables_level_prefetch(monkeypatch):
+    from fastapi.testclient import TestClient
+    import app as backend
+
+    async def build(request):
+        return {'levels': [{'word': 'Sol'}], 'source': 'llm', 'target': 'S'}
+
+    monkeypatch.setenv('CASSETTE_MODE', 'replay')
+    monkeypatch.setattr(backend, '_build_level', build)
+    scheduled = backend.level_prefetch.stats['scheduled']
+    response = TestClient(backend.app).post('/api/generate-levels',
+                                            json={'gameType': 'phoneme', 'session_id': 'cassette-session'})
+    assert response.status_code == 200
+    assert backend.level_prefetch.stats['scheduled'] == scheduled
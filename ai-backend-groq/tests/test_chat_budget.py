@@ -0,0 +1,51 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_budget import ContextBudgetExceeded, fit_to_budget, message_tokens, truncate_to_tokens
+
+
+def _conversation(turns, words=20):
+    messages = [{'role': 'system', 'content': 'Eres un tutor amable.'}]
+    for i in range(turns):
+        messages.append({'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"turno {i} " + 'hola ' * words})
+    return messages
+
+
+def test_small_conversation_untouched():
+    messages = _conversation(3)
+    fitted, info = fit_to_budget(messages, max_tokens=1000, summary_tokens=50)
+    assert fitted == messages
+    assert info['trimmed_turns'] == 0
+
+
+def test_long_history_trimmed_and_summarized():
+    messages = _conversation(40)
+    fitted, info = fit_to_budget(messages, max_tokens=400, summary_tokens=60)
+
+    assert sum(message_tokens(m) for m in fitted) <= 400
+    assert fitted[0] == messages[0]
+    assert fitted[-1] == messages[-1]
+    assert fitted[1]['content'].startswith('Earlier conversation')
+    assert info['summarized'] and info['trimmed_turns'] > 0
+    # Se conservan los turnos más recientes, en orden
+    kept = [m for m in fitted[2:]]
+    assert kept == messages[len(messages) - len(kept):]
+
+
+def test_last_message_over_budget_is_rejected():
+    with pytest.raises(ContextBudgetExceeded):
+        fit_to_budget([{'role': 'user', 'content': 'x' * 5000}], max_tokens=100)
+    assert truncate_to_tokens('una frase bastante larga', 2).endswith('…')
+
+
+def test_zero_token_budgets_keep_nothing():
+    assert truncate_to_tokens('una frase bastante larga', 0) == ''
+    assert truncate_to_tokens('una frase', -5) == ''
+    messages = [{'role': 'user', 'content': 'palabra ' * 200}, {'role': 'user', 'content': 'hola'}]
+    for summary_tokens in (0, -1):
+        trimmed, info = fit_to_budget(messages, max_tokens=50, summary_tokens=summary_tokens)
+        assert trimmed == messages[-1:] and not info['summarized']
@@ -0,0 +1,58 @@
+import os
+import sys
+import gzip
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_caching import HTTPCachingMiddleware, accepted_encodings, precompressed
+
+
+def _call(body, content_type, method='POST', headers=()):
+    async def downstream(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    scope = {'type': 'http', 'method': method, 'path': '/x', 'headers': list(headers)}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(HTTPCachingMiddleware(downstream)(scope, receive, send))
+    return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+
+def test_compresses_json_but_not_audio():
+    levels = b'{"levels": [' + b', '.join([b'{"word": "Mesa", "icon": "mesa", "isTarget": true}'] * 40) + b']}'
+    status, headers, body = _call(levels, b'application/json', headers=[(b'accept-encoding', b'gzip, br;q=0')])
+    assert headers[b'content-encoding'] == b'gzip'
+    assert gzip.decompress(body) == levels
+
+    mp3 = b'ID3' + bytes(4000)
+    _, headers, body = _call(mp3, b'audio/mp3', headers=[(b'accept-encoding', b'gzip')])
+    assert b'content-encoding' not in headers and body == mp3
+
+
+def test_etag_and_not_modified():
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg"/>'
+    status, headers, _ = _call(svg, b'image/svg+xml', method='GET')
+    assert status == 200
+    status, _, body = _call(svg, b'image/svg+xml', method='GET', headers=[(b'if-none-match', headers[b'etag'])])
+    assert status == 304 and body == b''
+
+
+def test_precompressed_sibling():
+    assert accepted_encodings('gzip;q=0.5, br;q=0, identity') == {'gzip', 'identity'}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'mesa.svg')
+        for name in (path, path + '.gz'):
+            with open(name, 'wb') as f:
+                f.write(b'<svg/>')
+        assert precompressed(path, 'gzip, br') == (path + '.gz', 'gzip')
+        assert precompressed(path, 'identity') == (path, None)
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import types
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import icon_variants
+from icon_variants import IconVariants, pick_size, valid_name
+
+
+def test_pick_size_and_names(monkeypatch):
+    monkeypatch.setenv('ICON_SIZES', '64,128,256')
+    assert pick_size(48) == 64
+    assert pick_size(100) == 128
+    assert pick_size(1024) == 256
+    assert valid_name('árbol') and valid_name('map-path')
+    assert not valid_name('../secret') and not valid_name('')
+
+
+def test_renders_missing_variants_once(monkeypatch):
+    rendered = []
+    fake_cairosvg = types.SimpleNamespace(
+        svg2png=lambda url, output_width, output_height: rendered.append(output_width) or b'PNG')
+    monkeypatch.setitem(sys.modules, 'cairosvg', fake_cairosvg)
+    monkeypatch.setitem(sys.modules, 'PIL', None)  # sin Pillow: solo PNG
+    monkeypatch.setenv('ICON_SIZES', '64,128')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        icons_dir = os.path.join(tmp, 'icons')
+        os.makedirs(icons_dir)
+        with open(os.path.join(icons_dir, 'mesa.svg'), 'w') as f:
+            f.write('<svg/>')
+
+        variants = IconVariants(icons_dir, os.path.join(tmp, 'out'))
+        assert variants.lookup('mesa', 64, 'png') is None
+        assert variants.render('mesa') == 2
+        assert variants.render('mesa') == 0
+        assert rendered == [64, 128]
+        assert open(variants.lookup('mesa', 64, 'png'), 'rb').read() == b'PNG'
+        assert variants.lookup('mesa', 64, 'webp') is None
+
+        # SVG regenerado -> las variantes quedan obsoletas
+        later = time.time() + 10
+        os.utime(variants.svg_path('mesa'), (later, later))
+        assert variants.lookup('mesa', 64, 'png') is None
+        assert variants.snapshot_stats()['formats'] == ['png']
+
+
+def test_sizes_ignore_invalid_values(monkeypatch):
+    monkeypatch.setenv('ICON_SIZES', '')
+    assert icon_variants.sizes() == [64, 128, 256]
+    monkeypatch.setenv('ICON_SIZES', 'abc, 128 ,-5,64,64')
+    assert icon_variants.sizes() == [64, 128]
@@ -0,0 +1,141 @@
+import os
+import sys
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from idempotency import IdempotencyMiddleware
+from ttl_cache import TTLCache
+
+
+def _request(body, key='abc'):
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/generate',
+             'headers': [(b'idempotency-key', key.encode())]}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    return scope, receive, send, sent
+
+
+def test_duplicates_wait_and_replay():
+    calls = []
+
+    async def downstream(scope, receive, send):
+        message = await receive()
+        calls.append(message['body'])
+        await asyncio.sleep(0.05)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'{"text": "ok"}'})
+
+    middleware = IdempotencyMiddleware(downstream, store=TTLCache('test', max_entries=4, ttl_seconds=60))
+
+    async def run():
+        requests = [_request(b'{"prompt": "hola"}') for _ in range(3)]
+        await asyncio.gather(*[middleware(scope, receive, send) for scope, receive, send, _ in requests])
+        conflict = _request(b'{"prompt": "otra"}')
+        await middleware(*conflict[:3])
+        return [r[3] for r in requests], conflict[3]
+
+    responses, conflict = asyncio.run(run())
+    assert calls == [b'{"prompt": "hola"}']
+    assert all(sent[1]['body'] == b'{"text": "ok"}' for sent in responses)
+    assert sum((b'idempotent-replayed', b'true') in sent[0]['headers'] for sent in responses) == 2
+    assert conflict[0]['status'] == 422
+
+
+def test_waiters_rerun_when_first_request_fails_without_response():
+    calls = []
+
+    async def downstream(scope, receive, send):
+        await receive()
+        calls.append(len(calls))
+        await asyncio.sleep(0.05)
+        if len(calls) == 1:
+            raise RuntimeError('boom')
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    middleware = IdempotencyMiddleware(downstream, store=TTLCache('test', max_entries=4, ttl_seconds=60))
+
+    async def run():
+        first, second = _request(b'{}'), _request(b'{}')
+        results = await asyncio.gather(middleware(*first[:3]), middleware(*second[:3]), return_exceptions=True)
+        return results, second[3]
+
+    results, sent = asyncio.run(run())
+    assert isinstance(results[0], RuntimeError)
+    # El duplicado no recibe un 500 inventado: ejecuta la petición él mismo
+    assert calls == [0, 1]
+    assert sent[0]['status'] == 200 and sent[1]['body'] == b'ok'
+
+
+def test_waiters_rerun_after_5xx():
+    calls = []
+
+    async def downstream(scope, receive, send):
+        await receive()
+        calls.append(len(calls))
+        await asyncio.sleep(0.05)
+        status = 503 if len(calls) == 1 else 200
+        await send({'type': 'http.response.start', 'status': status, 'headers': []})
+        await send({'type': 'http.response.body', 'body': str(status).encode()})
+
+    middleware = IdempotencyMiddleware(downstream, store=TTLCache('test', max_entries=4, ttl_seconds=60))
+
+    async def run():
+        first, second = _request(b'{}'), _request(b'{}')
+        await asyncio.gather(middleware(*first[:3]), middleware(*second[:3]))
+        return first[3], second[3]
+
+    first, second = asyncio.run(run())
+    assert calls == [0, 1]
+    assert first[0]['status'] == 503 and second[0]['status'] == 200
+    assert (b'idempotent-replayed', b'true') not in second[0]['headers']
+
+
+def test_large_body_is_spooled_and_streamed_in_chunks():
+    body = bytes(range(256)) * 1024  # 256 KiB
+    scope = {'type': 'http', 'method': 'POST', 'path': '/transcribe',
+             'headers': [(b'idempotency-key', b'big')]}
+    incoming = [body[i:i + 10000] for i in range(0, len(body), 10000)]
+    received = []
+
+    async def receive():
+        chunk = incoming.pop(0)
+        return {'type': 'http.request', 'body': chunk, 'more_body': bool(incoming)}
+
+    async def downstream(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message['body'])
+            if not message['more_body']:
+                break
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b'ok'})
+
+    async def send(message):
+        pass
+
+    middleware = IdempotencyMiddleware(downstream, store=TTLCache('test', max_entries=4, ttl_seconds=60),
+                                       spool_bytes=4096)
+    asyncio.run(middleware(scope, receive, send))
+    assert b''.join(received) == body
+    assert len(received) > 1 and max(len(chunk) for chunk in received) < len(body)
+
+
+def test_app_conflict_carries_cors_headers():
+    from fastapi.testclient import TestClient
+    import app as backend
+
+    client = TestClient(backend.app)
+    headers = {'Origin': 'https://eduplay.example', 'Idempotency-Key': 'cors-conflict-test'}
+    client.post('/tts', json={'text': ''}, headers=headers)
+    response = client.post('/tts', json={'text': 'otra'}, headers=headers)
+    assert response.status_code == 422
+    assert 'Idempotency-Key reused' in response.text
+    assert response.headers.get('access-control-allow-origin') in ('*', 'https://eduplay.example')
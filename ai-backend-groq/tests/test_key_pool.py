@@ -0,0 +1,52 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from key_pool import KeyPool, parse_duration
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_parse_duration():
+    assert parse_duration('2m59.56s') == 179.56
+    assert parse_duration('120ms') == 0.12
+    assert parse_duration('7') == 7
+    assert parse_duration('soon') is None
+
+
+def test_routes_to_key_with_most_headroom():
+    pool = KeyPool(['gsk_aaaaaaaaaaaa1111', 'gsk_bbbbbbbbbbbb2222'])
+    first = pool.acquire()
+    pool.release(first, 200, {'x-ratelimit-remaining-requests': '3', 'x-ratelimit-reset-requests': '1m'})
+    other = pool.acquire()
+    pool.release(other, 200, {'x-ratelimit-remaining-requests': '900', 'x-ratelimit-reset-requests': '1m'})
+    assert pool.acquire() == other
+
+
+def test_rate_limited_key_is_benched_and_request_retried():
+    pool = KeyPool(['gsk_aaaaaaaaaaaa1111', 'gsk_bbbbbbbbbbbb2222'], bench_seconds=60)
+    used = []
+
+    def send(key):
+        used.append(key)
+        return FakeResponse(429 if len(used) == 1 else 200)
+
+    assert pool.call(send).status_code == 200
+    assert len(set(used)) == 2
+    assert pool.acquire(available_only=True) == used[1]
+
+    snapshot = pool.snapshot()
+    assert snapshot['available'] == 1
+    assert sum(k['rate_limited'] for k in snapshot['per_key'].values()) == 1
+    assert all('aaaaaaaa' not in masked for masked in snapshot['per_key'])
+
+
+def test_burst_with_unknown_quota_spreads_across_keys():
+    pool = KeyPool(['key-aaaaaaaaaaaa', 'key-bbbbbbbbbbbb', 'key-cccccccccccc'])
+    acquired = [pool.acquire() for _ in range(6)]
+    assert sorted(acquired.count(k) for k in pool.keys) == [2, 2, 2]
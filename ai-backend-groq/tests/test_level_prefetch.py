@@ -0,0 +1,119 @@
+import os
+import sys
+import asyncio
+import contextvars
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from level_prefetch import LevelPrefetcher, compatible
+
+DEFAULTS = ['M', 'P', 'S', 'L', 'T']
+
+
+def _request(target=None, mistakes=None, difficulty='easy'):
+    context = {'mistakes': mistakes} if mistakes is not None else None
+    return SimpleNamespace(gameType='phoneme', difficulty=difficulty, limit=4, target=target, performance_context=context)
+
+
+def test_compatible_targets():
+    predicted = _request(target='S')
+    assert compatible(predicted, _request(target='s'), DEFAULTS)
+    assert not compatible(predicted, _request(target='R'), DEFAULTS)
+    assert compatible(predicted, _request(mistakes=['R', 'S']), DEFAULTS)
+    assert not compatible(predicted, _request(mistakes=['R']), DEFAULTS)
+    assert compatible(predicted, _request(), DEFAULTS)
+    assert not compatible(predicted, _request(target='S', difficulty='hard'), DEFAULTS)
+
+
+def test_hit_once_then_mismatch_and_stale():
+    async def build(request):
+        await asyncio.sleep(0.01)
+        return {'levels': [request.target], 'target': request.target}
+
+    async def run():
+        prefetcher = LevelPrefetcher(ttl_seconds=60, max_sessions=2)
+        prefetcher.schedule('s1', _request(target='M'), build)
+        hit = await prefetcher.take('s1', _request(target='M'), DEFAULTS)   # aún en curso
+        again = await prefetcher.take('s1', _request(target='M'), DEFAULTS)  # ya consumido
+
+        prefetcher.schedule('s1', _request(target='M'), build)
+        mismatch = await prefetcher.take('s1', _request(target='P'), DEFAULTS)
+
+        prefetcher.ttl_seconds = 0
+        prefetcher.schedule('s1', _request(target='M'), build)
+        await asyncio.sleep(0.02)
+        stale = await prefetcher.take('s1', _request(target='M'), DEFAULTS)
+        return prefetcher, hit, again, mismatch, stale
+
+    prefetcher, hit, again, mismatch, stale = asyncio.run(run())
+    assert hit == {'levels': ['M'], 'target': 'M'}
+    assert again is None and mismatch is None and stale is None
+    stats = prefetcher.snapshot_stats()
+    assert (stats['inflight_hits'], stats['mismatch'], stats['stale'], stats['misses']) == (1, 1, 1, 3)
+
+
+def test_speculation_runs_outside_the_request_context():
+    request_var = contextvars.ContextVar('request_var', default=None)
+
+    async def build(request):
+        return request_var.get()
+
+    async def run():
+        prefetcher = LevelPrefetcher(ttl_seconds=60, max_sessions=2)
+        request_var.set('req-1')
+        prefetcher.schedule('s1', _request(target='M'), build)
+        return await prefetcher.take('s1', _request(target='M'), DEFAULTS)
+
+    assert asyncio.run(run()) is None
+
+
+def test_icon_generation_does_not_block_the_loop(monkeypatch):
+    import time
+    import app as backend
+
+    class Vocabulary:
+        def assemble(self, target, limit, mistakes):
+            return [{'word': 'sol', 'icon': 'sol'}]
+
+    # Icono ausente: generarlo (LLM) bloquea ~0.2s
+    monkeypatch.setattr(backend, 'vocabulary', Vocabulary())
+    monkeypatch.setattr(backend, 'check_icon', lambda word: time.sleep(0.2))
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await backend._build_level(backend.GenerateLevelRequest(gameType='phoneme', target='S', limit=1))
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(run())
+    assert result['source'] == 'index' and result['target'] == 'S'
+    assert ticks >= 5
+
+
+def test_finished_speculations_survive_export_and_import():
+    async def build(request):
+        return {'levels': [request.target], 'target': request.target}
+
+    async def run():
+        prefetcher = LevelPrefetcher(ttl_seconds=60, max_sessions=2)
+        prefetcher.schedule('s1', _request(target='M'), build)
+        await asyncio.sleep(0)
+        entries = prefetcher.export_entries()
+
+        restored = LevelPrefetcher(ttl_seconds=60, max_sessions=2)
+        loaded = restored.import_entries(entries, lambda fields: SimpleNamespace(**fields))
+        expired = restored.import_entries([['s2', 1.0, vars(_request(target='S')), {}]], SimpleNamespace)
+        return loaded, expired, await restored.take('s1', _request(target='M'), DEFAULTS)
+
+    loaded, expired, hit = asyncio.run(run())
+    assert (loaded, expired) == (1, 0)
+    assert hit == {'levels': ['M'], 'target': 'M'}
@@ -0,0 +1,46 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from level_validation import (
+    parse_level_items, validate_phoneme_level, validate_math_level, phoneme_repair_prompt
+)
+
+
+def test_parse_unwraps_fences_and_objects():
+    assert parse_level_items('```json\n{"items": [{"word": "Sol"}]}\n```') == [{'word': 'Sol'}]
+    with pytest.raises(ValueError):
+        parse_level_items('{"level": 1}')
+
+
+def test_phoneme_rules():
+    items = [
+        {'word': 'Mesa', 'isTarget': True},
+        {'word': 'Sol', 'isTarget': True},       # target que no empieza por M
+        {'word': 'Mono', 'isTarget': False},     # distractor que sí empieza por M
+        {'word': 'mesa', 'isTarget': True},      # duplicado
+        {'word': 'null', 'isTarget': False},
+        {'word': 'Gato', 'isTarget': False},
+    ]
+    valid, stats = validate_phoneme_level(items, 'M', 5)
+    assert [i['word'] for i in valid] == ['Mesa', 'Gato']
+    assert stats['rejected'] == {'target_mismatch': 1, 'distractor_mismatch': 1, 'duplicate': 1, 'invalid_word': 1}
+
+    prompt = phoneme_repair_prompt(valid, 'M', 5)
+    assert 'exactly 3 new' in prompt and 'Mesa, Gato' in prompt
+
+
+def test_phoneme_keeps_room_for_a_distractor():
+    items = [{'word': w, 'isTarget': True} for w in ('Mesa', 'Mono', 'Mapa')]
+    valid, stats = validate_phoneme_level(items, 'M', 3)
+    assert len(valid) == 2 and stats['rejected'] == {'too_many_targets': 1}
+
+
+def test_math_answers_are_checked():
+    items = [{'q': '2 + 2', 'a': 4}, {'q': '3 - 5', 'a': -2}, {'q': '1+1', 'a': '3'}, {'q': '2+2', 'a': 4}]
+    valid, stats = validate_math_level(items, 5)
+    assert valid == [{'q': '2 + 2', 'a': 4}]
+    assert stats['rejected'] == {'wrong_answer': 2, 'duplicate': 1}
@@ -0,0 +1,68 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+import model_routing
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._body = body
+        self.text = str(body)
+
+    def json(self):
+        return self._body
+
+
+def test_fallback_on_error_and_stats(monkeypatch):
+    calls = []
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        calls.append((json['model'], json['max_tokens'], timeout))
+        if json['model'] == model_routing.get_route('speaking-chat')['model']:
+            raise requests.Timeout("slow")
+        return FakeResponse(200, {
+            'choices': [{'message': {'content': '¡Hola!'}}],
+            'usage': {'prompt_tokens': 12, 'completion_tokens': 3}
+        })
+
+    monkeypatch.setattr(requests, 'post', fake_post)
+
+    route = model_routing.get_route('speaking-chat')
+    result, model = model_routing.chat_completion('speaking-chat', [{'role': 'user', 'content': 'hola'}], 'http://groq', 'key')
+
+    assert model == route['fallback']
+    assert [c[0] for c in calls] == [route['model'], route['fallback']]
+    assert all(c[1] == route['max_tokens'] and c[2] == route['timeout'] for c in calls)
+
+    stats = model_routing.routes_snapshot()['stats']['speaking-chat']
+    assert stats[route['model']]['timeouts'] >= 1
+    assert stats[route['fallback']]['completion_tokens'] >= 3
+
+
+def test_explicit_arguments_override_route(monkeypatch):
+    seen = {}
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        seen.update(json)
+        return FakeResponse(200, {'choices': [{'message': {'content': 'ok'}}]})
+
+    monkeypatch.setattr(requests, 'post', fake_post)
+
+    _, model = model_routing.chat_completion('chat', [], 'http://groq', 'key', model='custom', max_tokens=5)
+    assert model == 'custom'
+    assert seen['max_tokens'] == 5
+    assert seen['temperature'] == model_routing.get_route('chat')['temperature']
+
+
+def test_routes_read_env_on_first_use(monkeypatch):
+    # Como con .env: la variable aparece después de importar el módulo
+    monkeypatch.setattr(model_routing, '_routes', None)
+    monkeypatch.setenv('MODEL_ROUTES', '{"speaking-chat": {"model": "custom-model"}}')
+    assert model_routing.get_route('speaking-chat')['model'] == 'custom-model'
+    assert model_routing.get_route('speaking-chat')['max_tokens'] == 20
+    monkeypatch.setattr(model_routing, '_routes', None)
@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from request_timing import ServerTimingMiddleware, stage
+
+
+def _call(middleware, headers=()):
+    scope = {'type': 'http', 'method': 'POST', 'path': '/api/generate-levels', 'headers': list(headers)}
+    sent = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return dict(sent[0]['headers'])
+
+
+async def _downstream(scope, receive, send):
+    with stage('parse'):
+        pass
+    # Las etapas registradas en threads (asyncio.to_thread) también cuentan y se suman
+    for _ in range(2):
+        await asyncio.to_thread(_slow_upstream)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+def _slow_upstream():
+    with stage('upstream'):
+        time.sleep(0.01)
+
+
+def test_server_timing_header_lists_stages():
+    headers = _call(ServerTimingMiddleware(_downstream))
+    metrics = dict(part.split(';dur=') for part in headers[b'server-timing'].decode().split(', '))
+    assert set(metrics) == {'parse', 'upstream', 'total'}
+    assert float(metrics['upstream']) >= 20
+    assert b'x-profile-id' not in headers
+
+
+def test_profile_requires_trusted_token(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        monkeypatch.setenv('PROFILE_DIR', tmp)
+        monkeypatch.setenv('PROFILE_TOKEN', 'secreto')
+
+        headers = _call(ServerTimingMiddleware(_downstream), [(b'x-profile', b'otro')])
+        assert b'x-profile-id' not in headers
+        assert os.listdir(tmp) == []
+
+        headers = _call(ServerTimingMiddleware(_downstream), [(b'x-profile', b'secreto')])
+        profile_id = headers[b'x-profile-id'].decode()
+        assert os.listdir(tmp) == [f"{profile_id}.folded"]
@@ -0,0 +1,89 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app as backend
+from key_pool import KeyPool
+from ttl_cache import TTLCache
+
+
+@pytest.fixture
+def client(monkeypatch):
+    transcribed = []
+
+    def fake_whisper(audio, audio_format, language):
+        transcribed.append((bytes(audio), audio_format, language))
+        return f"texto {len(transcribed)}"
+
+    async def fake_speech(text, language, slow):
+        return b'mp3:' + text.encode(), 'miss'
+
+    monkeypatch.setattr(backend, 'groq_keys', KeyPool(['gsk_test_key_0000']))
+    monkeypatch.setattr(backend, '_whisper_transcribe', fake_whisper)
+    monkeypatch.setattr(backend, '_speaking_reply', lambda text: f"reply to {text}")
+    monkeypatch.setattr(backend, '_cached_speech', fake_speech)
+    monkeypatch.setattr(backend, 'WS_MAX_TURN_BYTES', 8)
+    monkeypatch.setattr(backend, 'transcription_cache', TTLCache('test-transcribe', max_entries=8))
+    test_client = TestClient(backend.app)
+    test_client.transcribed = transcribed
+    return test_client
+
+
+def _receive_turn(ws):
+    """Messages of one processed turn, up to its 'done' (the audio frame as bytes)."""
+    messages = []
+    while True:
+        message = ws.receive_json()
+        messages.append(message)
+        if message['type'] == 'audio':
+            messages.append(ws.receive_bytes())
+        if message['type'] in ('done', 'error'):
+            return messages
+
+
+def test_audio_turn_protocol(client):
+    with client.websocket_connect('/ws/speaking') as ws:
+        ws.send_json({'type': 'start', 'format': 'webm', 'language': 'en', 'speed': 0.8})
+        ws.send_bytes(b'abc')
+        ws.send_bytes(b'def')
+        ws.send_json({'type': 'end'})
+        messages = _receive_turn(ws)
+
+    assert [m['type'] if isinstance(m, dict) else 'bytes' for m in messages] == \
+        ['transcript', 'reply', 'audio', 'bytes', 'done']
+    assert messages[0] == {'type': 'transcript', 'turn': 1, 'text': 'texto 1', 'cached': False}
+    assert messages[3] == b'mp3:reply to texto 1'
+    assert client.transcribed == [(b'abcdef', 'webm', 'en')]
+
+
+def test_oversized_turn_is_discarded_until_end(client):
+    with client.websocket_connect('/ws/speaking') as ws:
+        ws.send_bytes(b'x' * 6)
+        ws.send_bytes(b'y' * 6)
+        assert ws.receive_json() == {'type': 'error', 'turn': 1, 'detail': 'Audio demasiado grande'}
+        # La cola del audio demasiado grande no forma un turno
+        ws.send_bytes(b'zzzz')
+        ws.send_json({'type': 'end'})
+        ws.send_bytes(b'ok')
+        ws.send_json({'type': 'end'})
+        messages = _receive_turn(ws)
+
+    assert messages[0]['turn'] == 2
+    assert client.transcribed == [(b'ok', 'wav', 'es')]
+
+
+def test_text_turn_and_invalid_settings(client):
+    with client.websocket_connect('/ws/speaking') as ws:
+        ws.send_json({'type': 'start', 'speed': 'abc', 'format': '../etc'})
+        error = ws.receive_json()
+        assert error['type'] == 'error' and 'Invalid start settings' in error['detail']
+        ws.send_json({'type': 'text', 'message': 'hola'})
+        messages = _receive_turn(ws)
+
+    assert messages[0] == {'type': 'reply', 'turn': 1, 'text': 'reply to hola'}
+    assert messages[-1]['type'] == 'done'
+    assert client.transcribed == []
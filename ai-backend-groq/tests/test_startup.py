@@ -0,0 +1,29 @@
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import startup
+from startup import lazy_import
+
+
+def test_lazy_import_waits_for_import_in_progress(tmp_path, monkeypatch):
+    # Módulo lento: 'ready' solo existe al final de su import
+    (tmp_path / 'slow_startup_module.py').write_text(
+        "import time\ntime.sleep(0.3)\nready = True\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    warmup = threading.Thread(target=lazy_import, args=('slow_startup_module',))
+    warmup.start()
+    while 'slow_startup_module' not in sys.modules:
+        time.sleep(0.005)
+
+    # Otra petición durante el warm-up: recibe el módulo ya completo
+    module = lazy_import('slow_startup_module')
+    assert getattr(module, 'ready', False) is True
+    warmup.join()
+    assert 'slow_startup_module' in startup.report()['lazy_imports_ms']
+    assert lazy_import('slow_startup_module') is module
+    sys.modules.pop('slow_startup_module', None)
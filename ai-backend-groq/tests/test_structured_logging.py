@@ -0,0 +1,23 @@
+import os
+import sys
+import random
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structured_logging import SamplingFilter
+
+
+def _record(sample):
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, 'msg', (), None)
+    if sample:
+        record.sample = True
+    return record
+
+
+def test_sampling_only_affects_tagged_records():
+    random.seed(7)
+    sampling = SamplingFilter(0.1)
+    kept = sum(sampling.filter(_record(sample=True)) for _ in range(1000))
+    assert 50 < kept < 150
+    assert all(sampling.filter(_record(sample=False)) for _ in range(100))
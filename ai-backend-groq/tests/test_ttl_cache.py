@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ttl_cache import TTLCache, fingerprint
+
+
+def test_coalesces_concurrent_identical_keys():
+    cache = TTLCache('test', max_entries=4, ttl_seconds=60)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "hola"
+
+    async def run():
+        key = fingerprint(b"audio", "es")
+        results = await asyncio.gather(*[cache.get_or_compute(key, compute) for _ in range(5)])
+        again = await cache.get_or_compute(key, compute)
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert len(calls) == 1
+    assert sorted(source for _, source in results) == ['coalesced'] * 4 + ['miss']
+    assert again == ("hola", 'memory')
+
+
+def test_bounded_and_disk_backed():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TTLCache('test', max_entries=2, ttl_seconds=60, disk_dir=tmp)
+        for i in range(3):
+            cache.set(f"k{i}", {"text": str(i)})
+        assert len(cache) == 2
+
+        # k0 fue expulsado de memoria pero sigue en disco
+        assert cache.get("k0") == ({"text": "0"}, 'disk')
+
+        fresh = TTLCache('test', max_entries=2, ttl_seconds=60, disk_dir=tmp)
+        assert fresh.get("k2") == ({"text": "2"}, 'disk')
+
+
+def test_expired_entries_are_dropped():
+    cache = TTLCache('test', max_entries=2, ttl_seconds=60)
+    cache.set("k", "v", ttl_seconds=-1)
+    assert cache.get("k") == (None, None)
+
+
+def test_disk_is_bounded():
+    with tempfile.TemporaryDirectory() as disk_dir:
+        cache = TTLCache('test', max_entries=2, ttl_seconds=60, disk_dir=disk_dir, max_disk_entries=8)
+        for i in range(40):
+            cache.set(f'k{i}', i)
+        assert len(os.listdir(disk_dir)) <= 8
+        # Se conservan las más recientes
+        assert cache.get('k39') == (39, 'memory')
+        assert os.path.exists(os.path.join(disk_dir, 'k38.json'))
+
+        # Ficheros caducados: fuera en el siguiente barrido (p.ej. al arrancar)
+        old = time.time() - 120
+        for name in os.listdir(disk_dir):
+            os.utime(os.path.join(disk_dir, name), (old, old))
+        TTLCache('test', max_entries=2, ttl_seconds=60, disk_dir=disk_dir)
+        assert os.listdir(disk_dir) == []
+
+
+if __name__ == "__main__":
+    test_coalesces_concurrent_identical_keys()
+    test_bounded_and_disk_backed()
+    test_expired_entries_are_dropped()
+    test_disk_is_bounded()
+    print("✅ ttl_cache OK")
@@ -0,0 +1,66 @@
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vocabulary_index import VocabularyIndex, normalize
+
+
+def _index(tmp, min_pool=3):
+    icons = os.path.join(tmp, 'icons')
+    os.makedirs(icons)
+    for name in ('sol', 'mesa', 'icon-lock', 'cat'):
+        open(os.path.join(icons, f"{name}.svg"), 'w').close()
+    return VocabularyIndex(os.path.join(tmp, 'vocab.json'), icons, min_pool=min_pool)
+
+
+def test_seeds_from_icons_and_ingests_consistent_items():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _index(tmp)
+        assert set(index.letters) == {'S', 'M'}
+
+        accepted = index.ingest([
+            {'word': 'Mono', 'isTarget': True},
+            {'word': 'Mapa', 'isTarget': True},
+            {'word': 'Sapo', 'isTarget': True},   # no empieza por M: se descarta
+            {'word': 'Piña', 'isTarget': False},  # contiene ñ: se descarta
+            {'word': 'Árbol', 'isTarget': False},
+        ], 'M')
+        assert accepted == 3
+        assert normalize('Árbol') == 'ARBOL' and 'árbol' in index.letters['A']
+
+        reloaded = VocabularyIndex(os.path.join(tmp, 'vocab.json'), os.path.join(tmp, 'icons'))
+        assert {e['word'] for e in reloaded.pool('M')} == {'Mesa', 'Mono', 'Mapa'}
+
+
+def test_assemble_local_level_or_defer_to_llm():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _index(tmp)
+        assert index.assemble('L', 4) is None
+
+        index.ingest([{'word': w, 'isTarget': True} for w in ('Luna', 'Lobo', 'Leche', 'Lata')], 'L')
+        started = time.perf_counter()
+        level = index.assemble('L', 4, mistakes=['S'])
+        assert (time.perf_counter() - started) < 0.01
+
+        targets = [i for i in level if i['isTarget']]
+        distractors = [i for i in level if not i['isTarget']]
+        assert len(level) == 4 and len(distractors) == 1
+        assert all(normalize(i['word']).startswith('L') for i in targets)
+        assert not any(normalize(i['word']).startswith('L') for i in distractors)
+
+
+def test_concurrent_ingest_from_threads_saves_every_word():
+    from concurrent.futures import ThreadPoolExecutor
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _index(tmp)
+        words = [f"Pa{a}{b}" for a in 'bcdfg' for b in 'aeiou']
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            accepted = list(pool.map(lambda word: index.ingest([{'word': word, 'isTarget': True}], 'P'), words))
+        assert sum(accepted) == len(words)
+
+        reloaded = VocabularyIndex(os.path.join(tmp, 'vocab.json'), os.path.join(tmp, 'icons'))
+        assert len(reloaded.pool('P')) == len(words)
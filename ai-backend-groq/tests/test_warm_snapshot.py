@@ -0,0 +1,74 @@
+import os
+import sys
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import warm_snapshot
+from ttl_cache import TTLCache
+
+
+def _with_section(monkeypatch, tmp, cache):
+    monkeypatch.setenv('SNAPSHOT_PATH', os.path.join(tmp, 'snap.bin'))
+    monkeypatch.setattr(warm_snapshot, '_sections', [])
+    warm_snapshot.register_section('test', cache.export_entries, cache.import_entries)
+
+
+def test_round_trip_restores_entries(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TTLCache('test', max_entries=8, ttl_seconds=60)
+        cache.set('a', {'text': 'hola'})
+        cache.set('b', 'YWJj')
+        _with_section(monkeypatch, tmp, cache)
+        assert warm_snapshot.save() > 0
+
+        fresh = TTLCache('test', max_entries=8, ttl_seconds=60)
+        _with_section(monkeypatch, tmp, fresh)
+        loaded = asyncio.run(warm_snapshot.restore())
+
+        assert loaded == {'test': 2}
+        assert fresh.get('a') == ({'text': 'hola'}, 'memory')
+        assert fresh.get('b') == ('YWJj', 'memory')
+
+
+def test_corrupt_snapshot_starts_cold(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TTLCache('test', max_entries=8, ttl_seconds=60)
+        cache.set('a', 'x')
+        _with_section(monkeypatch, tmp, cache)
+        warm_snapshot.save()
+
+        path = os.path.join(tmp, 'snap.bin')
+        with open(path, 'r+b') as f:
+            f.seek(-4, os.SEEK_END)
+            f.write(b'\x00\x00\x00\x00')
+
+        fresh = TTLCache('test', max_entries=8, ttl_seconds=60)
+        _with_section(monkeypatch, tmp, fresh)
+        assert asyncio.run(warm_snapshot.restore()) == {}
+        assert len(fresh) == 0
+        assert os.path.exists(path + '.corrupt')
+
+
+def test_expired_entries_are_not_restored():
+    cache = TTLCache('test', max_entries=8, ttl_seconds=60)
+    assert cache.import_entries([['old', 1.0, 'x']]) == 0
+    assert len(cache) == 0
+
+
+def test_snapshot_without_sections_starts_cold(monkeypatch):
+    import zlib
+    import hashlib
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = TTLCache('test', max_entries=8, ttl_seconds=60)
+        _with_section(monkeypatch, tmp, cache)
+        # Checksum válido pero sin 'sections' (formato antiguo o escrito a medias)
+        body = zlib.compress(b'{"version": 1, "created_at": 0}')
+        path = os.path.join(tmp, 'snap.bin')
+        with open(path, 'wb') as f:
+            f.write(warm_snapshot.MAGIC + hashlib.sha256(body).digest() + body)
+
+        assert asyncio.run(warm_snapshot.restore()) == {}
+        assert os.path.exists(path + '.corrupt')
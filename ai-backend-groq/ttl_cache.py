@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(*parts):
+    """
+    Stable sha256 over a sequence of bytes/str parts (length-prefixed so
+    ("ab", "c") and ("a", "bc") never collide).
+    """
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        h.update(len(part).to_bytes(8, 'big'))
+        h.update(part)
+    return h.hexdigest()
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTL, optional JSON spill to disk and
+    coalescing of concurrent computations for the same key.
+
+    Values must be JSON serializable when `disk_dir` is set. The disk copy
+    is bounded too: expired files and the oldest ones beyond
+    `max_disk_entries` (default 4x max_entries) are swept periodically.
+    """
+
+    def __init__(self, name, max_entries=256, ttl_seconds=3600, disk_dir=None, max_disk_entries=None):
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self.disk_dir = disk_dir or None
+        self.max_disk_entries = max(1, int(max_disk_entries or self.max_entries * 4))
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._inflight = {}            # key -> asyncio.Future
+        self._disk_writes = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0, 'disk_evictions': 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self.sweep_disk()
+
+    # ---------- memory / disk ----------
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            # Entrada corrupta: se descarta
+            self._remove_disk(key)
+            return None
+
+        if record.get('expires_at', 0) <= time.time():
+            self._remove_disk(key)
+            return None
+        return record
+
+    def _write_disk(self, key, expires_at, value):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"⚠️ Cache '{self.name}': no se pudo escribir en disco: {e}")
+            return
+        self._disk_writes += 1
+        # Barrido cada ~1/8 del límite: el directorio nunca pasa mucho de max_disk_entries
+        if self._disk_writes % max(1, self.max_disk_entries // 8) == 0:
+            self.sweep_disk()
+
+    def sweep_disk(self):
+        """
+        Removes expired files (mtime older than the TTL) and, beyond
+        max_disk_entries, the oldest ones. Returns how many were removed.
+        """
+        if not self.disk_dir:
+            return 0
+        files = []
+        try:
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(('.json', '.tmp')):
+                        try:
+                            files.append((entry.stat().st_mtime, entry.path))
+                        except OSError:
+                            pass
+        except OSError:
+            return 0
+
+        files.sort()
+        cutoff = time.time() - self.ttl_seconds
+        excess = len(files) - self.max_disk_entries
+        removed = 0
+        for index, (mtime, path) in enumerate(files):
+            if mtime > cutoff and index >= excess:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        self.stats['disk_evictions'] += removed
+        return removed
+
+    def _remove_disk(self, key):
+        if not self.disk_dir:
+            return
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def get(self, key):
+        """Returns (value, source) with source 'memory' or 'disk', or (None, None)."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.time():
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return value, 'memory'
+            del self._entries[key]
+
+        record = self._read_disk(key)
+        if record is not None:
+            self._store_memory(key, record['expires_at'], record['value'])
+            self.stats['disk_hits'] += 1
+            return record['value'], 'disk'
+
+        return None, None
+
+    def _store_memory(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def set(self, key, value, ttl_seconds=None):
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        self._store_memory(key, expires_at, value)
+        self._write_disk(key, expires_at, value)
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+        self._remove_disk(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ---------- coalescing ----------
+
+    async def get_or_compute(self, key, compute):
+        """
+        Returns (value, source) where source is 'memory', 'disk', 'coalesced'
+        (waited on an identical in-flight computation) or 'miss'.
+
+        `compute` is an async callable; if it raises, nothing is cached and
+        every waiter gets the same exception.
+        """
+        value, source = self.get(key)
+        if source is not None:
+            return value, source
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(pending), 'coalesced'
+
+        self.stats['misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Evita "exception was never retrieved" si nadie más esperaba
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value, 'miss'
+        finally:
+            self._inflight.pop(key, None)
+
+    # ---------- warm restart ----------
+
+    def export_entries(self, limit=None):
+        """Live entries as [key, expires_at, value], least recently used first."""
+        now = time.time()
+        entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items() if expires_at > now]
+        return entries[-limit:] if limit else entries
+
+    def import_entries(self, entries):
+        """Restores exported entries (expired ones are dropped); returns how many were loaded."""
+        now = time.time()
+        loaded = 0
+        for key, expires_at, value in entries:
+            if expires_at > now and key not in self._entries:
+                self._store_memory(key, expires_at, value)
+                loaded += 1
+        return loaded
+
+    def snapshot_stats(self):
+        return {**self.stats, 'size': len(self._entries), 'inflight': len(self._inflight)}
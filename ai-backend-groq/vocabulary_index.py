@@ -0,0 +1,194 @@
+import os
+import json
+import random
+import logging
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Icon files that are not Spanish vocabulary (UI glyphs, English aliases of older levels)
+IGNORED_ICONS = {'cat', 'frog', 'rock', 'rose', 'map-path'}
+
+
+def normalize(word):
+    """'Árbol' -> 'ARBOL' (accents stripped, upper case) for initial-letter matching."""
+    decomposed = unicodedata.normalize('NFD', str(word).strip())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).upper()
+
+
+def is_valid_word(word):
+    """Same rules generate_levels applies to LLM output."""
+    if not word:
+        return False
+    text = str(word).strip()
+    if not text or text.lower() in ('none', 'null') or 'ñ' in text.lower():
+        return False
+    return True
+
+
+class VocabularyIndex:
+    """
+    Persistent map initial letter -> vetted words (with icon availability),
+    grown from validated generate_levels outputs and seeded from the icon set.
+    Lets phoneme levels be assembled locally instead of calling the LLM.
+    """
+
+    def __init__(self, path, icons_dir, min_pool=8):
+        self.path = path
+        self.icons_dir = icons_dir
+        self.min_pool = min_pool
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()  # ingest() guarda desde hilos: un escritor a la vez
+        self.letters = {}  # 'M' -> {'mesa': {'word': 'Mesa', 'icon': 'mesa', 'has_icon': True, 'seen': 3}}
+        self.stats = {'local_levels': 0, 'thin_pool': 0, 'ingested': 0}
+        self._load()
+        self._seed_from_icons()
+
+    # ---------- persistence ----------
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == 1:
+                self.letters = data.get('letters', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Vocabulary index ilegible ({self.path}), se reconstruye: {e}")
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with self.save_lock:
+                # Copia bajo el lock: otro hilo puede estar añadiendo palabras mientras se serializa
+                payload = {'version': 1, 'letters': self.export_letters()}
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(payload, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo guardar el vocabulary index: {e}")
+
+    def _seed_from_icons(self):
+        if not os.path.isdir(self.icons_dir):
+            return
+        for filename in os.listdir(self.icons_dir):
+            name, ext = os.path.splitext(filename)
+            if ext != '.svg' or name in IGNORED_ICONS or name.startswith('icon-') or not is_valid_word(name):
+                continue
+            self._add(name.capitalize(), has_icon=True, seen=0)
+
+    # ---------- building ----------
+
+    def _add(self, word, has_icon, seen=1):
+        key = str(word).strip().lower()
+        letter = normalize(key)[:1]
+        if not letter.isalpha():
+            return
+        with self.lock:
+            entry = self.letters.setdefault(letter, {}).get(key)
+            if entry is None:
+                self.letters[letter][key] = {'word': str(word).strip().capitalize(), 'icon': key,
+                                             'has_icon': has_icon, 'seen': seen}
+                self.stats['ingested'] += 1
+            else:
+                entry['has_icon'] = entry['has_icon'] or has_icon
+                entry['seen'] += seen
+
+    def _has_icon(self, key):
+        return os.path.exists(os.path.join(self.icons_dir, f"{key}.svg"))
+
+    def ingest(self, items, target):
+        """
+        Adds LLM items whose isTarget flag agrees with their initial letter;
+        returns how many were accepted.
+        """
+        prefix = normalize(target)
+        accepted = 0
+        for item in items:
+            word = item.get('word')
+            if not is_valid_word(word):
+                continue
+            starts = normalize(word).startswith(prefix)
+            if bool(item.get('isTarget')) != starts:
+                continue
+            self._add(word, has_icon=self._has_icon(str(word).strip().lower()))
+            accepted += 1
+        if accepted:
+            self.save()
+        return accepted
+
+    def export_letters(self):
+        with self.lock:
+            return {letter: dict(words) for letter, words in self.letters.items()}
+
+    def merge(self, letters):
+        """Adds words from a snapshot that the index does not know yet."""
+        added = 0
+        with self.lock:
+            for letter, words in letters.items():
+                known = self.letters.setdefault(letter, {})
+                for key, entry in words.items():
+                    if key not in known:
+                        known[key] = entry
+                        added += 1
+        return added
+
+    # ---------- assembling ----------
+
+    def pool(self, target):
+        prefix = normalize(target)
+        words = self.letters.get(prefix[:1], {})
+        return [entry for key, entry in words.items() if normalize(key).startswith(prefix)]
+
+    def assemble(self, target, limit, mistakes=None):
+        """
+        Builds a level (targets + 1-3 distractors) from the index, or returns
+        None when the target's pool is too thin and the LLM should grow it.
+        Distractors starting with other letters the child confuses are preferred.
+        """
+        targets_pool = self.pool(target)
+        if len(targets_pool) < max(self.min_pool, limit):
+            self.stats['thin_pool'] += 1
+            return None
+
+        n_distractors = min(3, max(1, limit // 3)) if limit > 1 else 0
+        n_targets = limit - n_distractors
+
+        prefix = normalize(target)
+        weak_letters = {normalize(m)[:1] for m in (mistakes or []) if m} - {prefix[:1]}
+        distractor_pool = []
+        weights = []
+        for letter, words in self.letters.items():
+            if letter == prefix[:1]:
+                continue
+            for entry in words.values():
+                distractor_pool.append(entry)
+                weight = 3 if letter in weak_letters else 1
+                weights.append(weight * (2 if entry['has_icon'] else 1))
+
+        if len(distractor_pool) < n_distractors:
+            self.stats['thin_pool'] += 1
+            return None
+
+        chosen_targets = random.sample(targets_pool, n_targets)
+        chosen_distractors = []
+        while len(chosen_distractors) < n_distractors:
+            entry = random.choices(distractor_pool, weights=weights, k=1)[0]
+            if entry not in chosen_distractors:
+                chosen_distractors.append(entry)
+
+        level = [{'word': e['word'], 'icon': e['icon'], 'isTarget': True} for e in chosen_targets]
+        level += [{'word': e['word'], 'icon': e['icon'], 'isTarget': False} for e in chosen_distractors]
+        random.shuffle(level)
+        self.stats['local_levels'] += 1
+        return level
+
+    def snapshot_stats(self):
+        with self.lock:
+            sizes = {letter: len(words) for letter, words in sorted(self.letters.items())}
+        return {**self.stats, 'letters': sizes}
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Formato: MAGIC (8 bytes, incluye versión) + sha256 del cuerpo (32 bytes) + JSON comprimido con zlib
+MAGIC = b'EDUSNAP1'
+FORMAT_VERSION = 1
+
+_sections = []  # [(name, dump_fn, load_fn)] in restore priority order
+
+
+def register_section(name, dump, load):
+    """
+    `dump()` returns JSON-serializable hot state (runs on the event loop);
+    `load(payload)` restores it and returns the number of items loaded.
+    Sections are restored in registration order, so register the hottest first.
+    """
+    _sections.append((name, dump, load))
+
+
+def _path():
+    return os.getenv('SNAPSHOT_PATH') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'data', 'warm_snapshot.bin')
+
+
+def enabled():
+    return os.getenv('SNAPSHOT_ENABLED', '1') == '1'
+
+
+def encode(sections):
+    body = zlib.compress(json.dumps({
+        'version': FORMAT_VERSION,
+        'created_at': time.time(),
+        'sections': sections
+    }, separators=(',', ':')).encode('utf-8'), 6)
+    return MAGIC + hashlib.sha256(body).digest() + body
+
+
+def decode(blob):
+    """Raises ValueError on a foreign, truncated, corrupted or incompatible snapshot."""
+    if len(blob) < len(MAGIC) + 32 or not blob.startswith(MAGIC):
+        raise ValueError("not a snapshot (bad magic/version)")
+    digest, body = blob[len(MAGIC):len(MAGIC) + 32], blob[len(MAGIC) + 32:]
+    if hashlib.sha256(body).digest() != digest:
+        raise ValueError("checksum mismatch")
+    data = json.loads(zlib.decompress(body))
+    if not isinstance(data, dict) or data.get('version') != FORMAT_VERSION:
+        raise ValueError(f"unsupported version {data.get('version') if isinstance(data, dict) else None}")
+    if not isinstance(data.get('sections'), dict):
+        raise ValueError("missing sections")
+    return data
+
+
+def _write(blob, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def _read(path):
+    max_bytes = int(os.getenv('SNAPSHOT_MAX_BYTES', 32 * 1024 * 1024))
+    if os.path.getsize(path) > max_bytes:
+        raise ValueError(f"snapshot larger than SNAPSHOT_MAX_BYTES ({max_bytes})")
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def _dump_sections():
+    sections = {}
+    for name, dump, _ in _sections:
+        try:
+            sections[name] = dump()
+        except Exception as e:
+            logger.warning(f"⚠️ Snapshot section '{name}' skipped: {e}")
+    return sections
+
+
+def save():
+    """Dumps every section and writes the snapshot atomically (blocking, used on shutdown)."""
+    if not enabled():
+        return None
+    started = time.perf_counter()
+    blob = encode(_dump_sections())
+    _write(blob, _path())
+    logger.info(f"💾 Snapshot saved ({len(blob)} bytes, {round((time.perf_counter() - started) * 1000)} ms)")
+    return len(blob)
+
+
+async def save_async():
+    """Dumps on the event loop (caches are not thread-safe), writes in a thread."""
+    if not enabled():
+        return None
+    sections = _dump_sections()
+    blob = await asyncio.to_thread(encode, sections)
+    await asyncio.to_thread(_write, blob, _path())
+    return len(blob)
+
+
+async def restore():
+    """
+    Loads the snapshot written by the previous process. A missing or corrupt
+    file only means a cold start; sections are applied until
+    SNAPSHOT_LOAD_BUDGET_MS runs out.
+    """
+    if not enabled():
+        return {}
+    path = _path()
+    if not os.path.exists(path):
+        return {}
+
+    started = time.perf_counter()
+    try:
+        data = await asyncio.to_thread(_read, path)
+        sections = data['sections']
+    except (OSError, ValueError, zlib.error) as e:
+        logger.warning(f"⚠️ Snapshot ignored ({e}), starting cold")
+        try:
+            os.replace(path, f"{path}.corrupt")
+        except OSError:
+            pass
+        return {}
+
+    budget_ms = float(os.getenv('SNAPSHOT_LOAD_BUDGET_MS', 2000))
+    loaded = {}
+    for name, _, load in _sections:
+        if (time.perf_counter() - started) * 1000 > budget_ms:
+            logger.warning(f"⚠️ Snapshot load budget exhausted before '{name}'")
+            break
+        payload = sections.get(name)
+        if payload is None:
+            continue
+        try:
+            loaded[name] = load(payload)
+        except Exception as e:
+            logger.warning(f"⚠️ Snapshot section '{name}' not restored: {e}")
+
+    age = round(time.time() - data.get('created_at', time.time()))
+    logger.info(
+        f"♨️ Snapshot restored in {round((time.perf_counter() - started) * 1000)} ms",
+        extra={'snapshot_age_s': age, 'loaded': loaded}
+    )
+    return loaded
+
+
+async def run_periodic():
+    interval = float(os.getenv('SNAPSHOT_INTERVAL', 300))
+    if not enabled() or interval <= 0:
+        return
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await save_async()
+        except Exception as e:
+            logger.warning(f"⚠️ Periodic snapshot failed: {e}")
@@ -65,6 +65,9 @@ export class GameManager {
             levelStartTime: null
         };
 
+        // Session ID sent to /api/generate-levels so the backend can prefetch the next level
+        this.levelSessionId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `s_${Date.now()}_${Math.random().toString(36).slice(2)}`;
+
         // Bind methods
         this.handleCardClick = this.handleCardClick.bind(this);
         this.checkAnswers = this.checkAnswers.bind(this);
@@ -159,7 +162,8 @@ export class GameManager {
                         difficulty: this.engine ? (this.engine.difficultyMultiplier > 1.5 ? 'hard' : (this.engine.difficultyMultiplier > 1.2 ? 'medium' : 'easy')) : 'medium',
                         limit: 5,
                         target: this.currentGameConfig.targetPhoneme || null, // Allow null to let backend/mistakes decide
-                        performance_context: performanceContext
+                        performance_context: performanceContext,
+                        session_id: this.levelSessionId
                     })
                 });
 